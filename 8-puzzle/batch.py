@@ -0,0 +1,185 @@
+"""
+Batch solving of many start states across a process pool.
+
+Start states are read one per line, comma separated like the single
+instance CLI, from a file or from stdin ("-"). Blank lines and lines
+starting with # are skipped. Every instance gets one JSON line on the
+output, in input order:
+
+    {"index": 0, "start": "1,2,5,3,4,0,6,7,8", "status": "solved",
+     "path": ["Up", ...], "cost": 3, "nodes_expanded": 3, "runtime": 0.0001}
+
+status is one of "solved", "unsolvable" (rejected by the parity check
+without searching), "budget_exceeded" or "invalid". Only a bounded window
+of instances is in flight at a time, so input is streamed rather than
+read whole. Pattern databases are opened, or built, by the parent before
+the first instance of their size is sent out, so workers only map them.
+"""
+import io
+import os
+import sys
+import json
+import math
+import contextlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from puzzle import (PuzzleState, LinearConflict, Manhattan, is_solvable,
+                    bfs_search, dfs_search, A_star_search)
+from instrumentation import SearchMonitor, BudgetExceeded
+
+SEARCHES = {"bfs": bfs_search, "dfs": dfs_search, "ast": A_star_search}
+
+# Budgets are checked every this many expansions
+BUDGET_GRANULARITY = 256
+
+_heuristics = {} # (name, n) -> heuristic, one per worker process
+
+
+def _heuristic(name, n):
+    """build each heuristic once per process, pattern databases are costly to open"""
+    heuristic = _heuristics.get((name, n))
+    if heuristic is None:
+        if name == "pdb":
+            from pattern_db import PatternDatabase
+            heuristic = PatternDatabase(n)
+        elif name == "lc":
+            heuristic = LinearConflict(n)
+        else:
+            heuristic = Manhattan(n)
+        _heuristics[(name, n)] = heuristic
+    return heuristic
+
+
+def solve_instance(index, line, algorithm="ast", heuristic=None, time_limit=None, node_limit=None):
+    """
+    Solve one start state.
+    :return the JSON serializable result record
+    """
+    line = line.strip()
+    result = {"index": index, "start": line}
+    try:
+        config = list(map(int, line.split(",")))
+        n = int(math.sqrt(len(config)))
+        state = PuzzleState(config, n)
+    except Exception as e:
+        result.update(status="invalid", error=str(e))
+        return result
+
+    if not is_solvable(config, n):
+        result.update(status="unsolvable")
+        return result
+
+    try:
+        heuristic = _heuristic(heuristic, n) if algorithm == "ast" else None
+    except Exception as e: # No pattern database for this size, say
+        result.update(status="invalid", error=str(e))
+        return result
+
+    monitor = SearchMonitor(sample_every=BUDGET_GRANULARITY, memory=None,
+                            time_limit=time_limit, node_limit=node_limit)
+    search = SEARCHES[algorithm]
+    try:
+        # The searches print writeOutput, which is not wanted here
+        with contextlib.redirect_stdout(io.StringIO()):
+            if algorithm == "ast":
+                path_to_goal = search(state, heuristic, monitor)
+            else:
+                path_to_goal = search(state, monitor)
+    except BudgetExceeded as e:
+        result.update(status="budget_exceeded", error=str(e),
+                      nodes_expanded=monitor.samples[-1]["nodes_expanded"],
+                      runtime=monitor.running_time)
+        return result
+
+    result.update(status="solved", path=path_to_goal, cost=len(path_to_goal),
+                  nodes_expanded=monitor.samples[-1]["nodes_expanded"],
+                  runtime=monitor.running_time)
+    return result
+
+
+def _instances(lines):
+    """(index, line) for every start state, skipping blanks and comments"""
+    index = 0
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        yield index, line
+        index += 1
+
+
+def _prepare(heuristic, line, prepared):
+    """
+    Open, or build, the pattern database for the size of line in this
+    process, once per size, so that workers only ever map a finished file.
+    Failures are left to the worker, which reports the instance invalid.
+    """
+    try:
+        n = math.isqrt(len(line.split(",")))
+    except Exception:
+        return
+    if n in prepared:
+        return
+    prepared.add(n)
+    try:
+        _heuristic(heuristic, n)
+    except Exception:
+        pass
+
+
+def run_batch(source, output, algorithm="ast", heuristic=None, workers=None,
+              time_limit=None, node_limit=None, window=None):
+    """
+    Solve every start state of source across a process pool.
+    :param source->iterable : Lines of comma separated start states
+    :param output->file : Receives one JSON line per instance, in input order
+    :param workers->int : Pool size, os.cpu_count() if None
+    :param window->int : Instances in flight at once, 8 per worker if None
+    :return number of instances written
+    """
+    if algorithm not in SEARCHES:
+        raise Exception("Unknown batch algorithm : ", algorithm)
+    workers = workers or os.cpu_count() or 1
+    window = window or 8 * workers
+
+    written = 0
+    pending = deque()
+    prepared = set() # Board sizes whose pattern database is ready
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for index, line in _instances(source):
+            if algorithm == "ast" and heuristic == "pdb":
+                _prepare(heuristic, line, prepared)
+            pending.append(pool.submit(solve_instance, index, line, algorithm,
+                                       heuristic, time_limit, node_limit))
+            if len(pending) >= window: # Emit the oldest before reading further
+                output.write(json.dumps(pending.popleft().result()) + "\n")
+                written += 1
+        while pending:
+            output.write(json.dumps(pending.popleft().result()) + "\n")
+            written += 1
+    output.flush()
+    return written
+
+
+def main(args, options):
+    """
+    puzzle.py batch <file or -> [bfs|dfs|ast] [manhattan|lc|pdb]
+        [--workers=N] [--time-limit=SECONDS] [--node-limit=N] [--output=PATH]
+    """
+    source = args[0] if args else "-"
+    algorithm = args[1].lower() if len(args) > 1 else "ast"
+    heuristic = args[2].lower() if len(args) > 2 else None
+    workers = int(options["workers"]) if options.get("workers") else None
+    time_limit = float(options["time-limit"]) if options.get("time-limit") else None
+    node_limit = int(options["node-limit"]) if options.get("node-limit") else None
+
+    infile = sys.stdin if source == "-" else open(source, "r")
+    outfile = open(options["output"], "w") if options.get("output") else sys.stdout
+    try:
+        run_batch(infile, outfile, algorithm, heuristic, workers, time_limit, node_limit)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
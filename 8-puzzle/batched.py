@@ -0,0 +1,218 @@
+"""
+NumPy batched searches over whole layers of boards.
+
+A layer is held as a (B, n*n) uint8 array of boards and a (B,) array of
+blank cells. All children of a layer are generated at once, one
+vectorized gather and scatter per direction, through a precomputed
+(cell, direction) -> target table. Boards are hashed by packing them into
+uint64 keys, the same layout as puzzle.encode. Deduplication is then a
+sort plus searchsorted against the sorted keys of the previous layers,
+and Manhattan distances for a whole batch are one fancy-indexed gather
+from the distance table.
+
+Parents are kept per layer as an index into the previous layer plus the
+move taken, 5 bytes per state, so paths can be rebuilt once the goal
+shows up. Packing into uint64 limits these searches to boards up to the
+15-puzzle.
+
+NumPy is an optional dependency, only needed by this module.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from puzzle import tile_bits, move_table, manhattan_table, writeOutput
+from instrumentation import SearchMonitor
+
+MOVES = ("Up", "Down", "Left", "Right")
+
+
+def _require_numpy(n):
+    if np is None:
+        raise Exception("The batched searches need numpy, install it with : pip install numpy")
+    if n * n * tile_bits(n) > 64:
+        raise Exception("The batched searches only handle boards up to 4x4 : ", n)
+
+
+def neighbour_table(n):
+    """(n*n, 4) array of the cell the blank moves to, per direction in UDLR order, -1 if off board"""
+    table = np.full((n * n, 4), -1, dtype=np.int64)
+    for cell, moves in enumerate(move_table(n)):
+        for action, target in moves:
+            table[cell, MOVES.index(action)] = target
+    return table
+
+
+def pack(boards, n):
+    """uint64 key of every board, equal to puzzle.encode of it"""
+    shifts = np.arange(n * n, dtype=np.uint64) * np.uint64(tile_bits(n))
+    return np.bitwise_or.reduce(boards.astype(np.uint64) << shifts, axis=1)
+
+
+def manhattan_batch(boards, n):
+    """Manhattan distance of every board in the batch"""
+    dist = np.asarray(manhattan_table(n), dtype=np.int16) # [tile][cell]
+    return dist[boards, np.arange(n * n)].sum(axis=1)
+
+
+def expand(boards, blanks, table):
+    """
+    Every child of every board in the batch.
+    :return (children, their blank cells, index of their parent, move index)
+    """
+    children, child_blanks, parents, moves = [], [], [], []
+    for direction in range(4):
+        targets = table[blanks, direction]
+        index = np.nonzero(targets >= 0)[0]
+        if len(index) == 0:
+            continue
+        target = targets[index]
+        rows = np.arange(len(index))
+        batch = boards[index]
+        batch[rows, blanks[index]] = batch[rows, target]
+        batch[rows, target] = 0
+        children.append(batch)
+        child_blanks.append(target)
+        parents.append(index.astype(np.uint32)) # Layers stay far below 2**32 boards
+        moves.append(np.full(len(index), direction, dtype=np.uint8))
+    return (np.concatenate(children), np.concatenate(child_blanks),
+            np.concatenate(parents), np.concatenate(moves))
+
+
+def member(keys, sorted_keys):
+    """boolean mask of the keys that appear in the sorted array sorted_keys"""
+    if len(sorted_keys) == 0:
+        return np.zeros(len(keys), dtype=bool)
+    index = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    return sorted_keys[index] == keys
+
+
+def _path(layers, index):
+    """follow the per-layer parent indices back from a state of the last layer"""
+    path_to_goal = []
+    for parents, moves in reversed(layers):
+        path_to_goal.append(MOVES[moves[index]])
+        index = parents[index]
+    path_to_goal.reverse()
+    return path_to_goal
+
+
+def bfs_batched(initial_state, monitor=None):
+    """
+    BFS search, one NumPy batch per layer
+    :param monitor->SearchMonitor : Collects metrics, a default one if None
+    """
+    n = initial_state.n
+    _require_numpy(n)
+    table = neighbour_table(n)
+    goal = pack(np.arange(n * n, dtype=np.uint8)[None, :], n)[0]
+
+    boards = np.array([initial_state.config], dtype=np.uint8)
+    blanks = np.array([initial_state.blank_index], dtype=np.int64)
+    keys = pack(boards, n)
+    previous_keys = keys[:0]
+    layers = [] # (parent index, move) arrays of every layer after the first
+    depth_histogram = {}
+
+    nodes_expanded = 0
+    generated = 0
+    duplicates = 0
+    if monitor is None:
+        monitor = SearchMonitor()
+    monitor.start()
+
+    found = 0 if keys[0] == goal else None
+    while found is None and len(boards):
+        depth_histogram[len(layers)] = len(boards)
+        children, child_blanks, parents, moves = expand(boards, blanks, table)
+        nodes_expanded += len(boards)
+        generated += len(children)
+
+        child_keys, first = np.unique(pack(children, n), return_index=True)
+        # The graph is bipartite, so a child can only repeat the parent layer or the one before
+        fresh = ~(member(child_keys, keys) | member(child_keys, previous_keys))
+        first = first[fresh]
+        duplicates += len(children) - len(first)
+
+        previous_keys, keys = keys, child_keys[fresh]
+        boards, blanks = children[first], child_blanks[first]
+        layers.append((parents[first], moves[first]))
+        monitor.sample(nodes_expanded, len(boards), generated, duplicates)
+
+        hit = np.nonzero(keys == goal)[0]
+        if len(hit):
+            found = hit[0]
+
+    monitor.finish(nodes_expanded, len(boards), generated, duplicates, depth_histogram)
+    if found is None:
+        return None
+    path_to_goal = _path(layers, found)
+    writeOutput(path_to_goal, str(len(path_to_goal)), nodes_expanded, len(path_to_goal),
+                len(layers), monitor.running_time, monitor.max_ram_usage)
+    return path_to_goal
+
+
+def beam_search(initial_state, width=1024, max_depth=None, monitor=None):
+    """
+    Beam search, keeping the width boards of lowest Manhattan distance of
+    every layer. Fast on huge instances but the path is not optimal.
+    :param width->int : Boards kept per layer
+    :param max_depth->int : Layers before giving up, 50*n*n if None
+    :param monitor->SearchMonitor : Collects metrics, a default one if None
+    """
+    n = initial_state.n
+    _require_numpy(n)
+    table = neighbour_table(n)
+    goal = pack(np.arange(n * n, dtype=np.uint8)[None, :], n)[0]
+    if max_depth is None:
+        max_depth = 50 * n * n
+
+    boards = np.array([initial_state.config], dtype=np.uint8)
+    blanks = np.array([initial_state.blank_index], dtype=np.int64)
+    keys = pack(boards, n)
+    seen = np.sort(keys) # Every key kept so far, so the beam never walks back
+    layers = []
+    depth_histogram = {}
+
+    nodes_expanded = 0
+    generated = 0
+    duplicates = 0
+    if monitor is None:
+        monitor = SearchMonitor()
+    monitor.start()
+
+    found = 0 if keys[0] == goal else None
+    while found is None and len(boards) and len(layers) < max_depth:
+        depth_histogram[len(layers)] = len(boards)
+        children, child_blanks, parents, moves = expand(boards, blanks, table)
+        nodes_expanded += len(boards)
+        generated += len(children)
+
+        child_keys, first = np.unique(pack(children, n), return_index=True)
+        fresh = ~member(child_keys, seen)
+        child_keys, first = child_keys[fresh], first[fresh]
+        duplicates += len(children) - len(first)
+
+        if len(first) > width:
+            h = manhattan_batch(children[first], n)
+            best = np.argpartition(h, width - 1)[:width]
+            child_keys, first = child_keys[best], first[best]
+
+        keys = child_keys
+        seen = np.union1d(seen, keys)
+        boards, blanks = children[first], child_blanks[first]
+        layers.append((parents[first], moves[first]))
+        monitor.sample(nodes_expanded, len(boards), generated, duplicates)
+
+        hit = np.nonzero(keys == goal)[0]
+        if len(hit):
+            found = hit[0]
+
+    monitor.finish(nodes_expanded, len(boards), generated, duplicates, depth_histogram)
+    if found is None:
+        return None
+    path_to_goal = _path(layers, found)
+    writeOutput(path_to_goal, str(len(path_to_goal)), nodes_expanded, len(path_to_goal),
+                len(layers), monitor.running_time, monitor.max_ram_usage)
+    return path_to_goal
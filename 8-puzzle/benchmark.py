@@ -0,0 +1,222 @@
+"""
+Benchmark harness for the 8-puzzle searches.
+
+The corpus is drawn from a full BFS of the 8-puzzle, bucketed by optimal
+depth (0-31) and sampled with a fixed seed, so the same instances come
+back on every run. Each algorithm is run on every bucket with warmup and
+repeated timed runs, plus one extra run under tracemalloc for peak
+memory, which is kept out of the timings. Every path found by an optimal
+search is checked against the exact distance of its bucket. Results are
+written as JSON and can be compared against a stored baseline:
+
+    python benchmark.py --algorithms=ast,ida --depths=20-31 --output=base.json
+    python benchmark.py --algorithms=ast,ida --depths=20-31 --baseline=base.json
+
+The run exits with status 1 if an optimal search returned a longer path,
+or if any bucket regressed.
+"""
+import io
+import sys
+import json
+import random
+import platform
+import statistics
+import contextlib
+
+from puzzle import (PuzzleState, LinearConflict, decode, parse_options,
+                    bfs_search, dfs_search, bibfs_search, A_star_search, ida_search)
+from instrumentation import SearchMonitor
+from oracle import goal_distances
+
+SEARCHES = {
+    "bfs": bfs_search,
+    "dfs": dfs_search,
+    "bibfs": bibfs_search,
+    "ast": A_star_search,
+    "ida": ida_search,
+}
+INFORMED = ("ast", "ida")
+OPTIMAL = ("bfs", "bibfs", "ast", "ida") # Must return paths of exactly the optimal length
+
+# Differences below these are noise, whatever the relative tolerance says
+MIN_TIME_DELTA = 0.001
+MIN_RAM_DELTA = 64
+
+
+def generate_corpus(depths=range(32), per_depth=2, seed=0):
+    """:return dict of depth to a list of start configs with that optimal distance"""
+    buckets = {}
+    for key, d in goal_distances(3).items():
+        if d in depths:
+            buckets.setdefault(d, []).append(key)
+    corpus = {}
+    for d in sorted(buckets):
+        keys = sorted(buckets[d])
+        rng = random.Random("%d-%d" % (seed, d)) # Same bucket whatever other depths are asked for
+        corpus[d] = [decode(key, 3) for key in rng.sample(keys, min(per_depth, len(keys)))]
+    return corpus
+
+
+def run_once(algorithm, config, heuristic=None, memory=None):
+    """
+    Solve one instance quietly.
+    :return (the SearchMonitor of the run, the path found)
+    """
+    monitor = SearchMonitor(sample_every=1 << 30, memory=memory)
+    state = PuzzleState(config, 3)
+    with contextlib.redirect_stdout(io.StringIO()):
+        if algorithm in INFORMED:
+            path_to_goal = SEARCHES[algorithm](state, heuristic, monitor)
+        else:
+            path_to_goal = SEARCHES[algorithm](state, monitor)
+    return monitor, path_to_goal
+
+
+def run_benchmark(corpus, algorithms, heuristic=None, warmup=1, repeat=3):
+    """
+    :return dict of algorithm to depth to the bucket's metrics; wall times
+    are per bucket totals, the median and best over the repeats, and
+    suboptimal counts the paths of an optimal search longer than the depth
+    """
+    results = {}
+    for algorithm in algorithms:
+        results[algorithm] = {}
+        for depth, configs in sorted(corpus.items()):
+            for _ in range(warmup):
+                for config in configs:
+                    run_once(algorithm, config, heuristic)
+
+            times = []
+            nodes = 0
+            suboptimal = 0
+            for _ in range(repeat):
+                total = 0.0
+                nodes = 0
+                suboptimal = 0
+                for config in configs:
+                    monitor, path_to_goal = run_once(algorithm, config, heuristic)
+                    total += monitor.running_time
+                    nodes += monitor.samples[-1]["nodes_expanded"]
+                    if algorithm in OPTIMAL and (path_to_goal is None or len(path_to_goal) != depth):
+                        suboptimal += 1
+                times.append(total)
+
+            peak = max(run_once(algorithm, config, heuristic, memory="tracemalloc")[0].max_ram_usage
+                       for config in configs)
+            results[algorithm][str(depth)] = {
+                "instances": len(configs),
+                "nodes_expanded": nodes,
+                "wall_time": statistics.median(times),
+                "wall_time_min": min(times),
+                "peak_kib": peak,
+                "suboptimal": suboptimal,
+            }
+            print("%-6s depth %2d  nodes %9d  time %10.6fs  peak %8d KiB"
+                  % (algorithm, depth, nodes, statistics.median(times), peak), file=sys.stderr)
+            if suboptimal:
+                print("WRONG %s depth %d: %d of %d paths not optimal"
+                      % (algorithm, depth, suboptimal, len(configs)))
+    return results
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    :return list of human readable regressions of results against baseline.
+    Node counts are deterministic, so any increase is one; best times and
+    peak memory have to grow by more than tolerance and the noise floor.
+    """
+    regressions = []
+    for algorithm, buckets in sorted(results.items()):
+        for depth, current in sorted(buckets.items(), key=lambda item: int(item[0])):
+            base = baseline.get(algorithm, {}).get(depth)
+            if base is None:
+                continue
+            label = "%s depth %s" % (algorithm, depth)
+            if current["nodes_expanded"] > base["nodes_expanded"]:
+                regressions.append("%s: nodes_expanded %d -> %d"
+                                   % (label, base["nodes_expanded"], current["nodes_expanded"]))
+            if (current["wall_time_min"] > base["wall_time_min"] * (1 + tolerance)
+                    and current["wall_time_min"] - base["wall_time_min"] > MIN_TIME_DELTA):
+                regressions.append("%s: wall_time_min %.6fs -> %.6fs"
+                                   % (label, base["wall_time_min"], current["wall_time_min"]))
+            if (current["peak_kib"] > base["peak_kib"] * (1 + tolerance)
+                    and current["peak_kib"] - base["peak_kib"] > MIN_RAM_DELTA):
+                regressions.append("%s: peak_kib %d -> %d"
+                                   % (label, base["peak_kib"], current["peak_kib"]))
+    return regressions
+
+
+def _depth_range(spec):
+    """"5", "0-31" or "3,7,9" to a list of depths"""
+    depths = []
+    for part in spec.split(","):
+        if "-" in part:
+            low, high = part.split("-")
+            depths.extend(range(int(low), int(high) + 1))
+        else:
+            depths.append(int(part))
+    return depths
+
+
+def main():
+    """
+    benchmark.py [--algorithms=bfs,dfs,bibfs,ast,ida] [--heuristic=manhattan|lc|pdb]
+        [--depths=0-31] [--per-depth=2] [--seed=0] [--warmup=1] [--repeat=3]
+        [--output=PATH] [--baseline=PATH] [--tolerance=0.25]
+    """
+    _, options = parse_options(sys.argv[1:])
+    algorithms = (options.get("algorithms") or "bfs,dfs,bibfs,ast,ida").split(",")
+    for algorithm in algorithms:
+        if algorithm not in SEARCHES:
+            raise Exception("Unknown algorithm : ", algorithm)
+
+    heuristic = None
+    if options.get("heuristic") == "lc":
+        heuristic = LinearConflict(3)
+    elif options.get("heuristic") == "pdb":
+        from pattern_db import PatternDatabase
+        heuristic = PatternDatabase(3)
+
+    depths = _depth_range(options.get("depths") or "0-31")
+    per_depth = int(options.get("per-depth") or 2)
+    seed = int(options.get("seed") or 0)
+    warmup = int(options.get("warmup") or 1)
+    repeat = int(options.get("repeat") or 3)
+
+    corpus = generate_corpus(depths, per_depth, seed)
+    results = run_benchmark(corpus, algorithms, heuristic, warmup, repeat)
+    failed = any(bucket["suboptimal"] for buckets in results.values() for bucket in buckets.values())
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "heuristic": options.get("heuristic") or "manhattan",
+            "per_depth": per_depth,
+            "seed": seed,
+            "warmup": warmup,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+    if options.get("output"):
+        with open(options["output"], "w") as f:
+            json.dump(report, f, indent=2)
+
+    if options.get("baseline"):
+        with open(options["baseline"]) as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("seed") != seed or baseline["meta"].get("per_depth") != per_depth:
+            print("warning: baseline was run on a different corpus", file=sys.stderr)
+        regressions = compare(results, baseline["results"], float(options.get("tolerance") or 0.25))
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if not regressions:
+            print("No regressions against %s" % options["baseline"])
+        failed = failed or bool(regressions)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
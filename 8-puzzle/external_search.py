@@ -0,0 +1,265 @@
+"""
+Disk-backed breadth first search for boards whose explored set does not
+fit in memory.
+
+Every BFS layer lives in its own file of packed keys, fixed width and
+big-endian so that byte order is numeric order, sorted and free of
+duplicates. To build layer d+1 the states of layer d are streamed from
+disk and their children are buffered up to chunk_size keys. Each full
+buffer is sorted and spilled as a run file. The runs are then k-way
+merged, dropping duplicates and anything also present in layers d and
+d-1, which are streamed alongside. On this graph those are the only
+layers a child can already be in. Resident memory is one buffer of
+chunk_size keys plus one read block per open file, whatever the size of
+the layer.
+
+No parent pointers are kept. Once the goal is generated, the path is
+recovered backwards by looking for a neighbour of the current state in
+the previous layer file, with a binary search on disk.
+"""
+import os
+import heapq
+import shutil
+import tempfile
+
+from puzzle import tile_bits, goal_key, move_table, writeOutput
+from instrumentation import SearchMonitor
+
+# Records read from disk at a time
+READ_BLOCK = 4096
+
+
+def record_width(n):
+    """bytes per packed key on disk"""
+    return (n * n * tile_bits(n) + 7) // 8
+
+
+def read_keys(path, width):
+    """stream the keys of a layer or run file in order"""
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(width * READ_BLOCK)
+            if not block:
+                return
+            for i in range(0, len(block), width):
+                yield int.from_bytes(block[i : i + width], "big")
+
+
+def write_keys(path, keys, width):
+    """write keys, already sorted, :return how many were written"""
+    count = 0
+    with open(path, "wb") as f:
+        buffer = []
+        for key in keys:
+            buffer.append(key.to_bytes(width, "big"))
+            count += 1
+            if len(buffer) >= READ_BLOCK:
+                f.write(b"".join(buffer))
+                buffer = []
+        f.write(b"".join(buffer))
+    return count
+
+
+def contains(path, key, width):
+    """binary search a sorted layer file for key"""
+    with open(path, "rb") as f:
+        low, high = 0, os.path.getsize(path) // width
+        while low < high:
+            mid = (low + high) // 2
+            f.seek(mid * width)
+            value = int.from_bytes(f.read(width), "big")
+            if value < key:
+                low = mid + 1
+            elif value > key:
+                high = mid
+            else:
+                return True
+    return False
+
+
+def _unique_excluding(merged, excluded):
+    """
+    Drop repeats from the sorted stream merged, and every key that also
+    appears in one of the sorted streams of excluded.
+    """
+    excluded = [iter(stream) for stream in excluded]
+    heads = [next(stream, None) for stream in excluded]
+    previous = None
+    for key in merged:
+        if key == previous:
+            continue
+        previous = key
+        found = False
+        for i, stream in enumerate(excluded):
+            head = heads[i]
+            while head is not None and head < key:
+                head = next(stream, None)
+            heads[i] = head
+            if head == key:
+                found = True
+        if not found:
+            yield key
+
+
+class ExternalBFS(object):
+    """
+        Layered BFS with every layer kept on disk under workdir.
+    """
+    def __init__(self, n, workdir=None, chunk_size=1 << 20):
+        """
+        :param n->int : Size of the board
+        :param workdir->string : Directory for layer and run files, a temporary one if None
+        :param chunk_size->int : Children buffered in memory before a sorted run is spilled
+        """
+        self.n          = n
+        self.bits       = tile_bits(n)
+        self.width      = record_width(n)
+        self.moves      = move_table(n)
+        self.chunk_size = chunk_size
+        self.owns_dir   = workdir is None
+        self.workdir    = tempfile.mkdtemp(prefix="puzzle-bfs-") if workdir is None else workdir
+        os.makedirs(self.workdir, exist_ok=True)
+        self.layer_sizes = []
+        self.nodes_expanded = 0
+        self.generated      = 0 # Children produced by expansions
+        self.duplicates     = 0 # Children already in the new layer or one of the two before it
+
+    def layer_path(self, depth):
+        return os.path.join(self.workdir, "layer_%04d.bin" % depth)
+
+    def blank(self, key):
+        """cell of the blank in a packed key"""
+        mask = (1 << self.bits) - 1
+        for i in range(self.n * self.n):
+            if (key >> (self.bits * i)) & mask == 0:
+                return i
+
+    def neighbours(self, key):
+        """(blank cell of the child, child key) for every move from key"""
+        bits = self.bits
+        mask = (1 << bits) - 1
+        blank = self.blank(key)
+        for _, target in self.moves[blank]:
+            shift = bits * target
+            tile = (key >> shift) & mask
+            yield target, key - (tile << shift) + (tile << (bits * blank))
+
+    def next_layer(self, depth, goal=None, monitor=None):
+        """
+        Build the file of layer depth + 1 from layer depth.
+        :return True if goal was generated
+        """
+        runs = []
+        buffer = set()
+        found = False
+        generated = self.generated
+        for key in read_keys(self.layer_path(depth), self.width):
+            self.nodes_expanded += 1
+            for _, child in self.neighbours(key):
+                self.generated += 1
+                buffer.add(child)
+                if child == goal:
+                    found = True
+            if len(buffer) >= self.chunk_size:
+                runs.append(self._spill(buffer, depth, len(runs)))
+                buffer = set()
+            if monitor is not None and self.nodes_expanded % monitor.sample_every == 0:
+                monitor.sample(self.nodes_expanded, self.layer_sizes[-1], self.generated, self.duplicates)
+        if buffer or not runs:
+            runs.append(self._spill(buffer, depth, len(runs)))
+
+        excluded = [read_keys(self.layer_path(d), self.width) for d in (depth, depth - 1) if d >= 0]
+        merged = heapq.merge(*[read_keys(run, self.width) for run in runs])
+        count = write_keys(self.layer_path(depth + 1), _unique_excluding(merged, excluded), self.width)
+        for run in runs:
+            os.remove(run)
+        self.duplicates += self.generated - generated - count # Everything that did not make the layer
+        self.layer_sizes.append(count)
+        return found
+
+    def _spill(self, keys, depth, index):
+        path = os.path.join(self.workdir, "run_%04d_%04d.bin" % (depth + 1, index))
+        write_keys(path, sorted(keys), self.width)
+        return path
+
+    def run(self, start, goal=None, max_depth=None, monitor=None):
+        """
+        Expand layers from start until goal is reached, a layer comes out
+        empty, or max_depth layers have been built.
+        :return depth of goal, or None
+        """
+        write_keys(self.layer_path(0), [start], self.width)
+        self.layer_sizes = [1]
+        if start == goal:
+            return 0
+        depth = 0
+        while self.layer_sizes[-1] > 0 and (max_depth is None or depth < max_depth):
+            if self.next_layer(depth, goal, monitor):
+                return depth + 1
+            depth += 1
+        return None
+
+    def path_to(self, key, depth):
+        """actions from the root to key, which lies in layer depth"""
+        n = self.n
+        names = {-n: "Up", n: "Down", -1: "Left", 1: "Right"}
+        path_to_goal = []
+        blank = self.blank(key)
+        for d in range(depth - 1, -1, -1):
+            layer = self.layer_path(d)
+            for previous_blank, previous in self.neighbours(key):
+                if contains(layer, previous, self.width):
+                    path_to_goal.append(names[blank - previous_blank])
+                    key, blank = previous, previous_blank
+                    break
+        path_to_goal.reverse()
+        return path_to_goal
+
+    def close(self):
+        """delete the working directory if it was created here"""
+        if self.owns_dir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def external_search(initial_state, workdir=None, chunk_size=1 << 20, monitor=None):
+    """
+    Disk-backed BFS search
+    :param workdir->string : Where layers are written, a temporary directory removed afterwards if None
+    :param chunk_size->int : Children buffered in memory before a sorted run is spilled
+    :param monitor->SearchMonitor : Collects metrics, a default sampling one if None
+    """
+    n = initial_state.n
+    search = ExternalBFS(n, workdir, chunk_size)
+    if monitor is None:
+        monitor = SearchMonitor()
+    monitor.start()
+    try:
+        depth = search.run(initial_state.key, goal_key(n), monitor=monitor)
+        histogram = dict(enumerate(search.layer_sizes[:-1]))
+        monitor.finish(search.nodes_expanded, search.layer_sizes[-1], search.generated, search.duplicates,
+                       histogram)
+        if depth is None:
+            return None
+        path_to_goal = search.path_to(goal_key(n), depth)
+    finally:
+        search.close()
+
+    writeOutput(path_to_goal, str(len(path_to_goal)), search.nodes_expanded, len(path_to_goal),
+                depth, monitor.running_time, monitor.max_ram_usage)
+    return path_to_goal
+
+
+def enumerate_layers(n, start=None, max_depth=None, workdir=None, chunk_size=1 << 20):
+    """
+    Full BFS layer enumeration from start, the goal by default.
+    :return list of layer sizes by depth
+    """
+    search = ExternalBFS(n, workdir, chunk_size)
+    try:
+        search.run(goal_key(n) if start is None else start, max_depth=max_depth)
+    finally:
+        search.close()
+    sizes = search.layer_sizes
+    while sizes and sizes[-1] == 0:
+        sizes.pop()
+    return sizes
@@ -0,0 +1,169 @@
+"""
+Low overhead metrics for the search loops.
+
+A search keeps its own counters in locals and only hands them to the
+SearchMonitor every sample_every expansions and once at the end, so the
+hot loop pays for one integer compare per node. Memory is read at those
+sample points only, either from getrusage or from tracemalloc.
+"""
+import io
+import sys
+import json
+import time
+import pstats
+import cProfile
+import resource
+import tracemalloc
+
+
+class BudgetExceeded(Exception):
+    """raised out of a search when its time or node budget runs out"""
+    pass
+
+
+class SearchMonitor(object):
+    """
+        Collects sampled memory readings and live counters for one search,
+        and optionally a cProfile of it, and reports them as JSON.
+    """
+    def __init__(self, sample_every=1024, memory="rusage", profile=False, live=None,
+                 time_limit=None, node_limit=None):
+        """
+        :param sample_every->int : Expansions between two samples
+        :param memory->string : "rusage", "tracemalloc" or None to skip memory readings
+        :param profile->bool : Run cProfile around the search
+        :param live->file : If given, every sample is written to it as a JSON line
+        :param time_limit->float : Seconds after which a sample raises BudgetExceeded
+        :param node_limit->int : Expansions after which a sample raises BudgetExceeded
+        """
+        if memory not in ("rusage", "tracemalloc", None):
+            raise Exception("Unknown memory source : ", memory)
+
+        self.sample_every = max(1, sample_every)
+        self.memory       = memory
+        self.live         = live
+        self.profiler     = cProfile.Profile() if profile else None
+        self.time_limit   = time_limit
+        self.node_limit   = node_limit
+
+        self.samples          = []
+        self.max_ram_usage    = 0 # In the units of ru_maxrss (KiB on Linux)
+        self.depth_histogram  = {}
+        self.max_search_depth = 0
+        self.start_time       = None
+        self.running_time     = 0
+        self._start_ram       = 0
+        self._last            = None
+
+    def _read_memory(self):
+        """memory in use since start, in KiB"""
+        if self.memory == "rusage":
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - self._start_ram
+        if self.memory == "tracemalloc":
+            return tracemalloc.get_traced_memory()[1] // 1024
+        return 0
+
+    def start(self):
+        """call right before the search loop"""
+        if self.memory == "rusage":
+            self._start_ram = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        elif self.memory == "tracemalloc":
+            tracemalloc.start()
+        self.start_time = time.perf_counter()
+        self._last = (self.start_time, 0)
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def sample(self, nodes_expanded, frontier_size, generated, duplicates):
+        """
+        record the counters of the search at this point, budgets are
+        checked here so they are enforced to within sample_every nodes
+        """
+        now = self._record(nodes_expanded, frontier_size, generated, duplicates)
+        if self.node_limit is not None and nodes_expanded >= self.node_limit:
+            self._stop()
+            raise BudgetExceeded("node budget of %d exceeded" % self.node_limit)
+        if self.time_limit is not None and now - self.start_time >= self.time_limit:
+            self._stop()
+            raise BudgetExceeded("time budget of %.3fs exceeded" % self.time_limit)
+
+    def _record(self, nodes_expanded, frontier_size, generated, duplicates):
+        """append one sample, :return its timestamp"""
+        now = time.perf_counter()
+        last_time, last_nodes = self._last
+        self._last = (now, nodes_expanded)
+        ram = self._read_memory()
+        self.max_ram_usage = max(self.max_ram_usage, ram)
+
+        elapsed = now - last_time
+        sample = {
+            "elapsed": now - self.start_time,
+            "nodes_expanded": nodes_expanded,
+            "nodes_per_sec": (nodes_expanded - last_nodes) / elapsed if elapsed > 0 else 0.0,
+            "frontier_size": frontier_size,
+            "duplicate_rate": duplicates / generated if generated else 0.0,
+            "ram_usage": ram,
+        }
+        self.samples.append(sample)
+        if self.live is not None:
+            self.live.write(json.dumps(sample) + "\n")
+            self.live.flush()
+        return now
+
+    def _stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.running_time = time.perf_counter() - self.start_time
+        if self.memory == "tracemalloc":
+            tracemalloc.stop()
+
+    def finish(self, nodes_expanded, frontier_size, generated, duplicates, depth_histogram):
+        """
+        call once the search is over
+        :param depth_histogram->dict : Expansions per depth
+        """
+        self._record(nodes_expanded, frontier_size, generated, duplicates)
+        self._stop()
+        self.depth_histogram = dict(sorted(depth_histogram.items()))
+        self.max_search_depth = max(self.depth_histogram, default=0)
+
+    def profile_rows(self, limit=25):
+        """the most expensive functions of the profiled search, by cumulative time"""
+        if self.profiler is None:
+            return []
+        stats = pstats.Stats(self.profiler, stream=io.StringIO())
+        rows = []
+        for (filename, line, name), (_, calls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                "function": "%s:%d(%s)" % (filename, line, name),
+                "calls": calls,
+                "tottime": tottime,
+                "cumtime": cumtime,
+            })
+        rows.sort(key=lambda row: row["cumtime"], reverse=True)
+        return rows[:limit]
+
+    def report(self):
+        """everything collected, as a JSON serializable dict"""
+        final = self.samples[-1] if self.samples else {}
+        return {
+            "running_time": self.running_time,
+            "nodes_expanded": final.get("nodes_expanded", 0),
+            "nodes_per_sec": final.get("nodes_expanded", 0) / self.running_time if self.running_time else 0.0,
+            "frontier_size": final.get("frontier_size", 0),
+            "duplicate_rate": final.get("duplicate_rate", 0.0),
+            "max_ram_usage": self.max_ram_usage,
+            "memory_source": self.memory,
+            "depth_histogram": {str(depth): count for depth, count in self.depth_histogram.items()},
+            "samples": self.samples,
+            "profile": self.profile_rows(),
+        }
+
+    def write_json(self, path):
+        """write the report to path, or to stdout for "-" """
+        if path == "-":
+            json.dump(self.report(), sys.stdout, indent=2)
+            sys.stdout.write("\n")
+        else:
+            with open(path, "w") as f:
+                json.dump(self.report(), f, indent=2)
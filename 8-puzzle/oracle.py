@@ -0,0 +1,195 @@
+"""
+Exact distance oracle for small boards.
+
+One BFS backwards from the goal records the optimal distance of every
+reachable state in a flat byte array. A state is ranked by its blank cell
+and the Lehmer code of its tiles read without the blank. Only half of the
+tile orders are reachable for a given blank cell, and the two orders that
+differ in their last pair of tiles have opposite parity. That lets the
+rank drop its last Lehmer digit, so the 8-puzzle needs exactly
+9 * 8!/2 = 181,440 bytes.
+
+Solving is then a greedy descent: from any state some move leads to a
+state one step closer, found with at most four lookups per move.
+"""
+import os
+import mmap
+import math
+import time
+import resource
+from collections import deque
+
+from puzzle import (tile_bits, decode, goal_key, move_table, is_solvable, writeOutput)
+
+MAGIC = b"ORC1"
+UNSEEN = 255
+
+
+def default_path(n):
+    """where the table for an n*n board is stored by default"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "oracle_%dx%d.bin" % (n, n))
+
+
+def rank(config):
+    """index of a solvable board in the oracle table"""
+    cells = len(config)
+    tiles = [tile for tile in config if tile != 0]
+    k = len(tiles)
+    lehmer = 0
+    for i in range(k - 2): # The digit of the last pair is implied by parity
+        smaller = 0
+        t = tiles[i]
+        for j in range(i + 1, k):
+            if tiles[j] < t:
+                smaller += 1
+        lehmer = lehmer * (k - i) + smaller
+    return config.index(0) * (math.factorial(cells - 1) // 2) + lehmer
+
+
+def goal_distances(n):
+    """
+    BFS from the goal over packed keys.
+    :return dict of the optimal distance of every reachable state by key
+    """
+    bits = tile_bits(n)
+    mask = (1 << bits) - 1
+    moves = move_table(n)
+    goal = goal_key(n)
+
+    dist = {goal: 0}
+    frontier = deque([(goal, 0)])
+    while frontier:
+        key, blank = frontier.popleft()
+        d = dist[key] + 1
+        for _, target in moves[blank]:
+            shift = bits * target
+            tile = (key >> shift) & mask
+            child = key - (tile << shift) + (tile << (bits * blank))
+            if child not in dist:
+                dist[child] = d
+                frontier.append((child, target))
+    return dist
+
+
+def build_table(n):
+    """:return bytearray of the distance of every state by rank"""
+    dist = goal_distances(n)
+    table = bytearray([UNSEEN]) * (math.factorial(n * n) // 2)
+    for key, d in dist.items():
+        table[rank(decode(key, n))] = d
+    return table
+
+
+def write_table(path, n, table):
+    """
+    Write the header and table under a temporary name, then rename it into
+    place, so processes that have the old file mapped never see it truncated.
+    """
+    temp_path = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(bytes([n]))
+            f.write(table)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+class Oracle(object):
+    """
+        Memory-mapped table of optimal distances for every state of an
+        n*n board, built on first use.
+    """
+    def __init__(self, n=3, path=None):
+        """
+        :param n->int : Size of the board, the table has (n*n)!/2 entries
+        :param path->string : Table file, built on first use if missing or stale
+        """
+        if n != 3: # The 15-puzzle would need 16!/2 bytes and a BFS over all of them
+            raise Exception("The distance oracle only supports 3x3 boards, got n = ", n)
+        if path is None:
+            path = default_path(n)
+
+        self.n    = n
+        self.path = path
+
+        self._file = None
+        self._mmap = self._open()
+        if self._mmap is None:
+            write_table(path, n, build_table(n))
+            self._mmap = self._open()
+        self.table = memoryview(self._mmap)[len(MAGIC) + 1:]
+
+    def _open(self):
+        """map the table file, or return None if it is missing or was built for another size"""
+        if not os.path.exists(self.path):
+            return None
+        f = open(self.path, "rb")
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # Empty file
+            f.close()
+            return None
+        size = len(MAGIC) + 1 + math.factorial(self.n * self.n) // 2
+        if mm[:len(MAGIC)] != MAGIC or mm[len(MAGIC)] != self.n or len(mm) != size:
+            mm.close()
+            f.close()
+            return None
+        self._file = f
+        return mm
+
+    def distance(self, config):
+        """optimal number of moves to the goal, or None if the board is unsolvable"""
+        if not is_solvable(config, self.n):
+            return None
+        return self.table[rank(config)]
+
+    def solve(self, config):
+        """
+        :return the optimal list of actions to the goal, or None if unsolvable
+        """
+        d = self.distance(config)
+        if d is None:
+            return None
+        config = list(config)
+        blank = config.index(0)
+        moves = move_table(self.n)
+        table = self.table
+        path_to_goal = []
+        while d > 0:
+            for action, target in moves[blank]:
+                config[blank], config[target] = config[target], 0
+                if table[rank(config)] == d - 1:
+                    break
+                config[blank], config[target] = 0, config[blank] # Undo, try the next move
+            path_to_goal.append(action)
+            blank = target
+            d -= 1
+        return path_to_goal
+
+    def close(self):
+        """release the table and the mapping"""
+        self.table.release()
+        self._mmap.close()
+        self._file.close()
+
+
+def oracle_search(initial_state, oracle=None):
+    """Answer from the precomputed distance table, no search"""
+    start_time = time.time()
+    start_ram_usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if oracle is None:
+        oracle = Oracle(initial_state.n)
+
+    path_to_goal = oracle.solve(initial_state.config)
+    if path_to_goal is None:
+        return None
+
+    max_ram_usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_ram_usage
+    running_time = time.time() - start_time
+    writeOutput(path_to_goal, str(len(path_to_goal)), len(path_to_goal), len(path_to_goal),
+                len(path_to_goal), running_time, max_ram_usage)
+    return path_to_goal
@@ -0,0 +1,216 @@
+"""
+Disjoint additive pattern databases for the sliding tile puzzle.
+
+Each pattern is a group of tiles. Its table holds, for every placement of
+those tiles, the fewest moves *of pattern tiles* needed to bring them home,
+found by a 0-1 breadth first search backwards from the goal. Since the
+groups are disjoint and only their own moves are counted, the lookups of
+all groups can be added and the sum stays admissible.
+
+Tables are one byte per entry, indexed by the cells of the pattern tiles
+read as base n*n digits. They are written to a single file once and then
+memory-mapped on later runs.
+"""
+import os
+import mmap
+from collections import deque
+
+from puzzle import tile_bits, move_table
+
+MAGIC = b"PDB1"
+UNSEEN = 255
+
+DEFAULT_PATTERNS = {
+    3: ((1, 2, 3, 4), (5, 6, 7, 8)),
+    4: ((1, 2, 3, 4, 5), (6, 7, 8, 9, 10), (11, 12, 13, 14, 15)),
+}
+
+
+def default_path(n):
+    """where the tables for an n*n board are stored by default"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "pattern_db_%dx%d.bin" % (n, n))
+
+
+def build_table(n, pattern):
+    """
+    0-1 BFS over (pattern tile cells, blank cell) starting from the goal.
+    :return bytearray of size (n*n)**len(pattern)
+    """
+    cells = n * n
+    k = len(pattern)
+    weights = [cells ** (k - 1 - j) for j in range(k)]
+    moves = [[target for _, target in row] for row in move_table(n)]
+
+    table = bytearray([UNSEEN]) * (cells ** k)
+    dist = bytearray([UNSEEN]) * (cells ** k * cells)
+
+    start = sum(tile * w for tile, w in zip(pattern, weights)) * cells # The blank starts on cell 0
+    dist[start] = 0
+    frontier = deque([start])
+
+    while frontier:
+        state = frontier.popleft()
+        d = dist[state]
+        index, blank = divmod(state, cells)
+        if d < table[index]:
+            table[index] = d
+
+        occupied = {}
+        rest = index
+        for j in range(k - 1, -1, -1):
+            rest, cell = divmod(rest, cells)
+            occupied[cell] = j
+
+        for target in moves[blank]:
+            j = occupied.get(target)
+            if j is None: # Blank moves over a tile outside the pattern, free
+                child = index * cells + target
+                if d < dist[child]:
+                    dist[child] = d
+                    frontier.appendleft(child)
+            else: # Pattern tile slides into the blank
+                child = (index + (blank - target) * weights[j]) * cells + target
+                if d + 1 < dist[child]:
+                    dist[child] = d + 1
+                    frontier.append(child)
+    return table
+
+
+def write_tables(path, n, patterns, tables):
+    """
+    Write the header followed by every table. The file is built under a
+    temporary name and renamed into place, so processes that have the old
+    file mapped never see it truncated.
+    """
+    temp_path = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(bytes([n, len(patterns)]))
+            for pattern in patterns:
+                f.write(bytes([len(pattern)]))
+                f.write(bytes(pattern))
+            for table in tables:
+                f.write(table)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def _read_header(mm):
+    """:return (n, patterns, offset of the first table), or None if malformed"""
+    if len(mm) < 6 or mm[:4] != MAGIC:
+        return None
+    n, count = mm[4], mm[5]
+    offset = 6
+    patterns = []
+    for _ in range(count):
+        if offset >= len(mm):
+            return None
+        k = mm[offset]
+        patterns.append(tuple(mm[offset + 1 : offset + 1 + k]))
+        offset += 1 + k
+    return n, tuple(patterns), offset
+
+
+class PatternDatabase(object):
+    """
+        Memory-mapped additive pattern database. Call it with a packed key
+        to get the heuristic value of that board. Same interface as
+        puzzle.Manhattan, so it can be passed to any search.
+    """
+    consistent = False # Entries are minima over blank cells, admissible only
+
+    def __init__(self, n, patterns=None, path=None):
+        """
+        :param n->int : Size of the board
+        :param patterns->tuple of tuples : Disjoint tile groups, defaults to DEFAULT_PATTERNS[n]
+        :param path->string : Table file, built on first use if missing or stale
+        """
+        if patterns is None:
+            if n not in DEFAULT_PATTERNS:
+                raise Exception("No default patterns for n, pass patterns explicitly : ", n)
+            patterns = DEFAULT_PATTERNS[n]
+        patterns = tuple(tuple(p) for p in patterns)
+        tiles = [tile for pattern in patterns for tile in pattern]
+        if len(tiles) != len(set(tiles)) or not set(tiles) <= set(range(1, n * n)):
+            raise Exception("Patterns must be disjoint groups of tiles : ", patterns)
+        if path is None:
+            path = default_path(n)
+
+        self.n        = n
+        self.bits     = tile_bits(n)
+        self.patterns = patterns
+        self.path     = path
+
+        self._file = None
+        self._mmap = self._open()
+        if self._mmap is None:
+            write_tables(path, n, patterns, [build_table(n, p) for p in patterns])
+            self._mmap = self._open()
+
+        cells = n * n
+        _, _, offset = _read_header(self._mmap)
+        view = memoryview(self._mmap)
+        self.tables = []
+        for pattern in patterns:
+            size = cells ** len(pattern)
+            self.tables.append(view[offset : offset + size])
+            offset += size
+
+        # tile -> (pattern number, weight of its cell in the table index)
+        self.weights = [None] * cells
+        for p, pattern in enumerate(patterns):
+            for j, tile in enumerate(pattern):
+                self.weights[tile] = (p, cells ** (len(pattern) - 1 - j))
+
+    def _open(self):
+        """map the table file, or return None if it is missing, truncated or was built for other patterns"""
+        if not os.path.exists(self.path):
+            return None
+        f = open(self.path, "rb")
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # Empty file
+            f.close()
+            return None
+        header = _read_header(mm)
+        cells = self.n * self.n
+        if (header is None or header[:2] != (self.n, self.patterns)
+                or len(mm) != header[2] + sum(cells ** len(p) for p in self.patterns)):
+            mm.close()
+            f.close()
+            return None
+        self._file = f
+        return mm
+
+    def __call__(self, key):
+        """heuristic value of the board with this packed key"""
+        weights = self.weights
+        bits = self.bits
+        mask = (1 << bits) - 1
+        index = [0] * len(self.tables)
+        for cell in range(self.n * self.n):
+            tile = (key >> (bits * cell)) & mask
+            if tile:
+                w = weights[tile]
+                if w is not None:
+                    index[w[0]] += cell * w[1]
+        h = 0
+        for table, i in zip(self.tables, index):
+            h += table[i]
+        return h
+
+    def update(self, h, key, child, tile, src, dst):
+        """value of child, reached from key by sliding tile from src to dst"""
+        return self(child)
+
+    def close(self):
+        """release the tables and the mapping"""
+        for table in self.tables:
+            table.release()
+        self.tables = []
+        self._mmap.close()
+        self._file.close()
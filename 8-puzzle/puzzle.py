@@ -5,17 +5,94 @@ from __future__ import print_function
 import sys
 import math
 import time
-import queue as Q
-import resource
+import bisect
+from collections import deque, defaultdict
 import heapq
 
+from instrumentation import SearchMonitor
+
 #### SKELETON CODE ####
+## Packed board encoding
+# A board is stored as a single int: the tile at position i occupies bits
+# [b*i, b*i + b), with b = tile_bits(n). Children only need a couple of
+# shifts to build, and the key itself is what goes into the explored sets.
+_move_tables = {}
+_manhattan_tables = {}
+_goal_keys = {}
+
+def tile_bits(n):
+    """bits used per tile on an n*n board, 4 up to the 15-puzzle"""
+    return 4 if n <= 4 else (n * n - 1).bit_length()
+
+def encode(config, n=None):
+    """pack a board list into its integer key"""
+    if n is None:
+        n = int(math.sqrt(len(config)))
+    bits = tile_bits(n)
+    key = 0
+    for i, tile in enumerate(config):
+        key |= tile << (bits * i)
+    return key
+
+def decode(key, n):
+    """unpack an integer key into a board list"""
+    bits = tile_bits(n)
+    mask = (1 << bits) - 1
+    return [(key >> (bits * i)) & mask for i in range(n * n)]
+
+def goal_key(n):
+    """packed key of the n*n goal board, blank in the top left corner"""
+    key = _goal_keys.get(n)
+    if key is None:
+        key = _goal_keys[n] = encode(range(n * n), n)
+    return key
+
+def move_table(n):
+    """
+    For every blank position, the (action, target index) pairs reachable
+    from it in UDLR order. Built once per board size.
+    """
+    table = _move_tables.get(n)
+    if table is None:
+        table = []
+        for i in range(n * n):
+            moves = []
+            if i >= n:
+                moves.append(("Up", i - n))
+            if i < n * (n - 1):
+                moves.append(("Down", i + n))
+            if i % n != 0:
+                moves.append(("Left", i - 1))
+            if i % n != n - 1:
+                moves.append(("Right", i + 1))
+            table.append(tuple(moves))
+        table = _move_tables[n] = tuple(table)
+    return table
+
+# The action that undoes each move
+OPPOSITE = {"Up": "Down", "Down": "Up", "Left": "Right", "Right": "Left"}
+
+def manhattan_table(n):
+    """
+    dist[tile][idx] is the manhattan distance of tile from its goal cell
+    when it sits at idx. The blank contributes nothing.
+    """
+    table = _manhattan_tables.get(n)
+    if table is None:
+        table = [[0] * (n * n)]
+        for tile in range(1, n * n):
+            table.append([calculate_manhattan_dist(idx, tile, n) for idx in range(n * n)])
+        table = _manhattan_tables[n] = tuple(tuple(row) for row in table)
+    return table
+
 ## The Class that Represents the Puzzle
 class PuzzleState(object):
     """
         The PuzzleState stores a board configuration and implements
         movement instructions to generate valid children.
     """
+    __slots__ = ("n", "cost", "parent", "action", "key", "blank_index", "h")
+
     def __init__(self, config, n, parent=None, action="Initial", cost=0):
         """
         :param config->List : Represents the n*n board, for e.g. [0,1,2,3,4,5,6,7,8] represents the goal state.
@@ -33,90 +110,87 @@ class PuzzleState(object):
         self.cost     = cost
         self.parent   = parent
         self.action   = action
-        self.config   = config
-        self.children = []
+        self.key      = encode(config, n)
+
+        # Get the index of empty block
+        self.blank_index = config.index(0)
+
+        # Heuristic estimate, filled in by the search that uses one
+        self.h = 0
 
-        # Get the index and (row, col) of empty block
-        self.blank_index = self.config.index(0)
+    @property
+    def config(self):
+        """ The board as a list, decoded from the packed key """
+        return decode(self.key, self.n)
 
     def display(self):
         """ Display this Puzzle state as a n*n board """
+        config = self.config
         for i in range(self.n):
-            print(self.config[3*i : 3*(i+1)])
+            print(config[self.n*i : self.n*(i+1)])
+
+    def child(self, action, target, heuristic=None):
+        """
+        Slides the tile at index target into the blank.
+        :param heuristic : If given, the child's h is updated from this state's h
+        :return a PuzzleState with the new configuration
+        """
+        bits = tile_bits(self.n)
+        shift = bits * target
+        tile = (self.key >> shift) & ((1 << bits) - 1)
+        state = PuzzleState.__new__(PuzzleState)
+        state.n           = self.n
+        state.cost        = self.cost + 1
+        state.parent      = self
+        state.action      = action
+        state.key         = self.key - (tile << shift) + (tile << (bits * self.blank_index))
+        state.blank_index = target
+        if heuristic is not None:
+            state.h = heuristic.update(self.h, self.key, state.key, tile, target, self.blank_index)
+        return state
+
+    def move(self, action):
+        """
+        Moves the blank tile in the direction named by action.
+        :return a PuzzleState with the new configuration, or None if the move is not possible
+        """
+        for name, target in move_table(self.n)[self.blank_index]:
+            if name == action:
+                return self.child(name, target)
+        return None
 
     def move_up(self):
         """ 
         Moves the blank tile one row up.
         :return a PuzzleState with the new configuration
         """
-        i = self.blank_index
-        new_state = None
-        if i > 2:
-            new_config = (self.config).copy()
-            new_config[i] = self.config[i - self.n]
-            new_config[i - self.n] = 0
-            new_state = PuzzleState(new_config, self.n, parent=self, action="Up", cost=self.cost+1)
-        return new_state
+        return self.move("Up")
       
     def move_down(self):
         """
         Moves the blank tile one row down.
         :return a PuzzleState with the new configuration
         """
-        i = self.blank_index
-        new_state = None
-        if i < 6:
-            new_config = (self.config).copy()
-            new_config[i] = self.config[i + self.n]
-            new_config[i + self.n] = 0
-            new_state = PuzzleState(new_config, self.n, parent=self, action="Down", cost=self.cost+1)
-        return new_state
+        return self.move("Down")
       
     def move_left(self):
         """
         Moves the blank tile one column to the left.
         :return a PuzzleState with the new configuration
         """
-        i = self.blank_index
-        new_state = None
-        if i % self.n != 0:
-            new_config = (self.config).copy()
-            new_config[i] = self.config[i - 1]
-            new_config[i - 1] = 0
-            new_state = PuzzleState(new_config, self.n, parent=self, action="Left", cost=self.cost+1)
-        return new_state
+        return self.move("Left")
 
     def move_right(self):
         """
         Moves the blank tile one column to the right.
         :return a PuzzleState with the new configuration
         """
-        i = self.blank_index
-        new_state = None
-        if i % self.n != self.n - 1:
-            new_config = (self.config).copy()
-            new_config[i] = self.config[i + 1]
-            new_config[i + 1] = 0
-            new_state = PuzzleState(new_config, self.n, parent=self, action="Right", cost=self.cost+1)
-        return new_state
+        return self.move("Right")
       
-    def expand(self):
-        """ Generate the child nodes of this node """
-        
-        # Node has already been expanded
-        if len(self.children) != 0:
-            return self.children
-        
-        # Add child nodes in order of UDLR
-        children = [
-            self.move_up(),
-            self.move_down(),
-            self.move_left(),
-            self.move_right()]
-
-        # Compose self.children of all non-None children states
-        self.children = [state for state in children if state is not None]
-        return self.children
+    def expand(self, heuristic=None):
+        """ Generate the child nodes of this node in order of UDLR """
+        return [self.child(action, target, heuristic)
+                for action, target in move_table(self.n)[self.blank_index]]
     
     def __eq__(self, x):
         return (self.cost == x.cost)
@@ -149,170 +223,649 @@ def writeOutput(path_to_goal, cost_of_path, nodes_expanded, search_depth,
     print("running_time: " + str("%.8f" % running_time))
     print("max_ram_usage: " + str("%.8f" % (max_ram_usage/(1024*1024))))
 
-def bfs_search(initial_state):
-    """BFS search"""
-    start = PuzzleState(initial_state.config, 3)
-    frontier = Q.Queue() # Queue implementation for the fringe
-    explored = set()
-    frontier.put(start)
+def get_path(state):
+    """follow parent links back to the root and return the actions taken"""
+    path_to_goal = []
+    while state.parent is not None:
+        path_to_goal.append(state.action)
+        state = state.parent
+    path_to_goal.reverse()
+    return path_to_goal
+
+def _report(state, nodes_expanded, max_search_depth, monitor):
+    """writeOutput for a goal state reached by a monitored search"""
+    path_to_goal = get_path(state)
+    writeOutput(path_to_goal, str(state.cost), nodes_expanded, len(path_to_goal),
+                max_search_depth, monitor.running_time, monitor.max_ram_usage)
+    return path_to_goal
+
+def bfs_search(initial_state, monitor=None):
+    """
+    BFS search
+    :param monitor->SearchMonitor : Collects metrics, a default sampling one if None
+    """
+    start = PuzzleState(initial_state.config, initial_state.n)
+    frontier = deque() # Queue implementation for the fringe
+    explored = set() # Keys of every state already added to the frontier
+    frontier.append(start)
+    explored.add(start.key)
     
     nodes_expanded = 0
-    search_depth = 0
+    generated = 0
+    duplicates = 0
     max_search_depth = 0
-    max_ram_usage = 0
+    depth_histogram = defaultdict(int)
     
-    start_time = time.time()
-    start_ram_usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
-    curr_ram_usage = 0 # Keeps track of memory usage
+    if monitor is None:
+        monitor = SearchMonitor()
+    sample_every = monitor.sample_every
+    monitor.start()
     
-    while not frontier.empty():
-        state = frontier.get()
-        
-        curr_ram_usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_ram_usage
-        max_ram_usage = max(curr_ram_usage, max_ram_usage)
-            
-        if tuple(state.config) not in explored:
-            explored.add(tuple(state.config))
-            if test_goal(state):
-                path_to_goal = []
-                cost_of_path = str(state.cost)
-                while (state.action != "Initial"):
-                    path_to_goal.append(state.action)
-                    state = state.parent
-                path_to_goal.reverse()
-                search_depth = len(path_to_goal)
-                running_time = time.time() - start_time
-                writeOutput(path_to_goal, cost_of_path, nodes_expanded, search_depth, 
-                            max_search_depth, running_time, max_ram_usage)
-                return path_to_goal
+    while frontier:
+        state = frontier.popleft()
             
-            children = state.expand()
-            nodes_expanded += 1
-            for neighbor in children:
-                if tuple(neighbor.config) not in explored:
-                    frontier.put(neighbor)
-                    max_search_depth = max(neighbor.cost, max_search_depth)
+        if test_goal(state):
+            monitor.finish(nodes_expanded, len(frontier), generated, duplicates, depth_histogram)
+            return _report(state, nodes_expanded, max_search_depth, monitor)
+        
+        children = state.expand()
+        nodes_expanded += 1
+        depth_histogram[state.cost] += 1
+        generated += len(children)
+        for neighbor in children:
+            if neighbor.key not in explored:
+                explored.add(neighbor.key)
+                frontier.append(neighbor)
+                max_search_depth = max(neighbor.cost, max_search_depth)
+            else:
+                duplicates += 1
+        if nodes_expanded % sample_every == 0:
+            monitor.sample(nodes_expanded, len(frontier), generated, duplicates)
+    
+    monitor.finish(nodes_expanded, 0, generated, duplicates, depth_histogram)
 
-def dfs_search(initial_state):
-    """DFS search"""
-    start = PuzzleState(initial_state.config, 3)
+def dfs_search(initial_state, monitor=None):
+    """
+    DFS search
+    :param monitor->SearchMonitor : Collects metrics, a default sampling one if None
+    """
+    start = PuzzleState(initial_state.config, initial_state.n)
     frontier = [] # Stack implementation for the fringe
-    frontier_tracker = set() # No direct use, tracks if state has already been added to frontier
-    explored = set()
+    explored = set() # Keys of every state already added to the frontier
     frontier.append(start)
-    frontier_tracker.add(tuple(initial_state.config)) 
+    explored.add(start.key)
     
     nodes_expanded = 0
-    search_depth = 0
+    generated = 0
+    duplicates = 0
     max_search_depth = 0
-    max_ram_usage = 0
+    depth_histogram = defaultdict(int)
     
-    start_time = time.time()
-    start_ram_usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
-    curr_ram_usage = 0 # Keeps track of memory usage
+    if monitor is None:
+        monitor = SearchMonitor()
+    sample_every = monitor.sample_every
+    monitor.start()
     
     while frontier:
         state = frontier.pop()
-        frontier_tracker.remove(tuple(state.config))
-        
-        curr_ram_usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_ram_usage
-        max_ram_usage = max(curr_ram_usage, max_ram_usage)
             
-        if tuple(state.config) not in explored:
-            explored.add(tuple(state.config))
-            if test_goal(state):
-                path_to_goal = []
-                cost_of_path = str(state.cost)
-                while (state.action != "Initial"):
-                    path_to_goal.append(state.action)
-                    state = state.parent
-                path_to_goal.reverse()
-                search_depth = len(path_to_goal)
-                running_time = time.time() - start_time
-                writeOutput(path_to_goal, cost_of_path, nodes_expanded, search_depth, 
-                            max_search_depth, running_time, max_ram_usage)
-                return path_to_goal
-            
-            children = state.expand()
-            children.reverse()
+        if test_goal(state):
+            monitor.finish(nodes_expanded, len(frontier), generated, duplicates, depth_histogram)
+            return _report(state, nodes_expanded, max_search_depth, monitor)
+        
+        children = state.expand()
+        children.reverse()
+        nodes_expanded += 1
+        depth_histogram[state.cost] += 1
+        generated += len(children)
+        for neighbor in children:
+            if neighbor.key not in explored:
+                explored.add(neighbor.key)
+                frontier.append(neighbor)
+                max_search_depth = max(neighbor.cost, max_search_depth)
+            else:
+                duplicates += 1
+        if nodes_expanded % sample_every == 0:
+            monitor.sample(nodes_expanded, len(frontier), generated, duplicates)
+    
+    monitor.finish(nodes_expanded, 0, generated, duplicates, depth_histogram)
+
+def bibfs_search(initial_state, monitor=None):
+    """
+    Bidirectional BFS search, None for an unsolvable start
+    :param monitor->SearchMonitor : Collects metrics, a default sampling one if None
+    """
+    n = initial_state.n
+    bits = tile_bits(n)
+    mask = (1 << bits) - 1
+    moves = move_table(n)
+    goal = goal_key(n)
+    
+    # key -> (neighbouring key one step closer to that side's root, action, depth)
+    # Forward actions lead from the parent to the key, backward ones from the key to the goal
+    forward = {initial_state.key: (None, None, 0)}
+    backward = {goal: (None, None, 0)}
+    forward_layer = [(initial_state.key, initial_state.blank_index)]
+    backward_layer = [(goal, 0)]
+    
+    nodes_expanded = 0
+    generated = 0
+    duplicates = 0
+    max_search_depth = 0
+    depth_histogram = defaultdict(int)
+    
+    if monitor is None:
+        monitor = SearchMonitor()
+    sample_every = monitor.sample_every
+    monitor.start()
+    
+    if not is_solvable(initial_state.config, n): # The two halves could never meet
+        monitor.finish(0, 0, 0, 0, depth_histogram)
+        return None
+    
+    meet = initial_state.key if initial_state.key == goal else None
+    while meet is None and forward_layer and backward_layer:
+        # Grow whichever side has the smaller frontier by one full layer
+        if len(forward_layer) <= len(backward_layer):
+            layer, seen, other, is_forward = forward_layer, forward, backward, True
+        else:
+            layer, seen, other, is_forward = backward_layer, backward, forward, False
+        
+        next_layer = []
+        best = math.inf
+        for key, blank in layer:
             nodes_expanded += 1
-            for neighbor in children:
-                if tuple(neighbor.config) not in (explored and frontier_tracker):
-                    frontier.append(neighbor)
-                    frontier_tracker.add(tuple(neighbor.config))
-                    max_search_depth = max(neighbor.cost, max_search_depth)
+            depth = seen[key][2] + 1
+            depth_histogram[depth - 1] += 1
+            generated += len(moves[blank])
+            if nodes_expanded % sample_every == 0:
+                monitor.sample(nodes_expanded, len(forward_layer) + len(backward_layer), generated, duplicates)
+            for action, target in moves[blank]:
+                shift = bits * target
+                tile = (key >> shift) & mask
+                child = key - (tile << shift) + (tile << (bits * blank))
+                if child in seen:
+                    duplicates += 1
+                    continue
+                seen[child] = (key, action if is_forward else OPPOSITE[action], depth)
+                next_layer.append((child, target))
+                if child in other and depth + other[child][2] < best:
+                    best = depth + other[child][2]
+                    meet = child
+        max_search_depth = max(max_search_depth, depth)
+        
+        if is_forward:
+            forward_layer = next_layer
+        else:
+            backward_layer = next_layer
+    
+    monitor.finish(nodes_expanded, len(forward_layer) + len(backward_layer), generated, duplicates, depth_histogram)
+    if meet is None:
+        return None
+    
+    # Splice the two half paths together at the meeting state
+    path_to_goal = []
+    key = meet
+    while forward[key][0] is not None:
+        path_to_goal.append(forward[key][1])
+        key = forward[key][0]
+    path_to_goal.reverse()
+    key = meet
+    while backward[key][0] is not None:
+        path_to_goal.append(backward[key][1])
+        key = backward[key][0]
+    
+    writeOutput(path_to_goal, str(len(path_to_goal)), nodes_expanded, len(path_to_goal),
+                max_search_depth, monitor.running_time, monitor.max_ram_usage)
+    return path_to_goal
 
 class PriorityQueue:
+    """
+        Binary heap of (f, h, insertion order, state) entries with a hash
+        index from packed key to the live entry of that state. Pushing a
+        cheaper path to a queued state marks the old entry stale instead
+        of searching the heap for it; stale entries are skipped on pop.
+        Ties on f go to the lower h, then to the earlier push.
+    """
     def __init__(self):
         self.heap = []
+        self.entries = {}
+        self.counter = 0
 
-    def push(self, cost, state):
-       heapq.heappush(self.heap, (cost, state))
+    def push(self, cost, state, h=0):
+        """
+        Queue state with priority cost unless it is already queued with a
+        g-cost at least as good.
+        :return True if the state was queued
+        """
+        entry = self.entries.get(state.key)
+        if entry is not None:
+            if entry[3].cost <= state.cost:
+                return False
+            entry[3] = None # Stale, skipped when it surfaces
+        entry = [cost, h, self.counter, state]
+        self.counter += 1
+        self.entries[state.key] = entry
+        heapq.heappush(self.heap, entry)
+        return True
 
     def pop(self):
-       return heapq.heappop(self.heap)[1]
+        """remove and return the live state with the lowest priority"""
+        while self.heap:
+            state = heapq.heappop(self.heap)[3]
+            if state is not None:
+                del self.entries[state.key]
+                return state
+        raise KeyError("pop from an empty priority queue")
+
+    def peek(self):
+        """lowest priority among the live entries"""
+        while self.heap[0][3] is None:
+            heapq.heappop(self.heap)
+        return self.heap[0][0]
+
+    def states(self):
+        """every live queued state, in no particular order"""
+        return [entry[3] for entry in self.entries.values()]
 
     def empty(self):
-        return len(self.heap) == 0
+        return len(self.entries) == 0
+
+    def __len__(self):
+        return len(self.entries)
     
-    def contains(self, state):
-        if(state in self.heap):
-            return True
-        return False
+    def contains(self, key):
+        return key in self.entries
+
+    def g_cost(self, key):
+        """best path cost queued for key, or None if it is not queued"""
+        entry = self.entries.get(key)
+        return None if entry is None else entry[3].cost
     
-def A_star_search(initial_state):
-    """A * search"""
-    start = PuzzleState(initial_state.config, 3)
+def A_star_search(initial_state, heuristic=None, monitor=None, cache=None):
+    """
+    A * search. A closed state is reopened when a cheaper path to it turns
+    up, so the path stays optimal with admissible but inconsistent
+    heuristics such as PatternDatabase.
+    :param heuristic : Manhattan, LinearConflict or PatternDatabase, Manhattan if None
+    :param monitor->SearchMonitor : Collects metrics, a default sampling one if None
+    :param cache->SolutionCache : Answers cached states outright, stops the search early once a
+                                  cached state gives a path no open node can beat, and learns
+                                  every state on the path found
+    """
+    start = PuzzleState(initial_state.config, initial_state.n)
     frontier = PriorityQueue() # Priority queue implementation for the fringe
-    explored = set()
-    cost = calculate_total_cost(start)
-    frontier.push(cost, start)
+    explored = {} # Packed key -> g-cost the state was closed with
+    if heuristic is None:
+        heuristic = Manhattan(start.n)
+    start.h = heuristic(start.key)
+    frontier.push(start.h, start, start.h)
     
     nodes_expanded = 0
-    search_depth = 0
+    generated = 0
+    duplicates = 0
     max_search_depth = 0
-    max_ram_usage = 0
+    depth_histogram = defaultdict(int)
+    
+    if monitor is None:
+        monitor = SearchMonitor()
+    sample_every = monitor.sample_every
+    monitor.start()
     
-    start_time = time.time()
-    start_ram_usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
-    curr_ram_usage = 0 # Keeps track of memory usage
+    if cache is not None:
+        path_to_goal = cache.path_from(start)
+        if path_to_goal is not None: # Solved before, no search needed
+            monitor.finish(0, 0, 0, 0, depth_histogram)
+            writeOutput(path_to_goal, str(len(path_to_goal)), 0, len(path_to_goal),
+                        len(path_to_goal), monitor.running_time, monitor.max_ram_usage)
+            return path_to_goal
     
+    incumbent = None # (cost, state, cached actions from state) of the best path through a cached state
     while not frontier.empty():
+        if incumbent is not None and frontier.peek() >= incumbent[0]:
+            break # No open node can beat the cached path any more
         state = frontier.pop()
-        
-        curr_ram_usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_ram_usage
-        max_ram_usage = max(curr_ram_usage, max_ram_usage)
-            
-        if tuple(state.config) not in explored:
-            explored.add(tuple(state.config))
-            if test_goal(state):
-                path_to_goal = []
-                cost_of_path = str(state.cost)
-                while (state.action != "Initial"):
-                    path_to_goal.append(state.action)
-                    state = state.parent
-                path_to_goal.reverse()
-                search_depth = len(path_to_goal)
-                running_time = time.time() - start_time
-                writeOutput(path_to_goal, cost_of_path, nodes_expanded, search_depth, 
-                            max_search_depth, running_time, max_ram_usage)
-                return path_to_goal
+        explored[state.key] = state.cost
             
-            children = state.expand()
+        if test_goal(state):
+            monitor.finish(nodes_expanded, len(frontier), generated, duplicates, depth_histogram)
+            path_to_goal = _report(state, nodes_expanded, max_search_depth, monitor)
+            if cache is not None:
+                cache.store(start, path_to_goal)
+            return path_to_goal
+        
+        children = state.expand(heuristic)
+        nodes_expanded += 1
+        depth_histogram[state.cost] += 1
+        generated += len(children)
+        for neighbor in children:
+            closed_cost = explored.get(neighbor.key)
+            if ((closed_cost is None or neighbor.cost < closed_cost) # Unseen, or reopened cheaper
+                    and frontier.push(neighbor.cost + neighbor.h, neighbor, neighbor.h)):
+                max_search_depth = max(neighbor.cost, max_search_depth)
+                if cache is not None:
+                    # Memory only, one dbm read per child costs more than it saves
+                    distance = cache.distance(neighbor.key, disk=False)
+                    if distance is not None and (incumbent is None or neighbor.cost + distance < incumbent[0]):
+                        suffix = cache.path_from(neighbor) # None if part of it was evicted
+                        if suffix is not None:
+                            incumbent = (neighbor.cost + distance, neighbor, suffix)
+            else:
+                duplicates += 1
+        if nodes_expanded % sample_every == 0:
+            monitor.sample(nodes_expanded, len(frontier), generated, duplicates)
+    
+    monitor.finish(nodes_expanded, len(frontier), generated, duplicates, depth_histogram)
+    if incumbent is not None:
+        path_to_goal = get_path(incumbent[1]) + incumbent[2]
+        writeOutput(path_to_goal, str(len(path_to_goal)), nodes_expanded, len(path_to_goal),
+                    max(max_search_depth, len(path_to_goal)), monitor.running_time, monitor.max_ram_usage)
+        cache.store(start, path_to_goal)
+        return path_to_goal
+
+def ara_search(initial_state, heuristic=None, deadline=1.0, weight=3.0, weight_step=0.5,
+               on_solution=None, monitor=None):
+    """
+    Anytime repairing A * (ARA*) search. Runs weighted A* with a high
+    weight for a quick first path, then lowers the weight and repairs the
+    same search, rather than starting over, to improve the path, until
+    the weight reaches 1 or the deadline expires. ARA* defers states that
+    improve after being closed to the next weight, which only keeps its
+    bounds for consistent heuristics. With any other heuristic, such as
+    PatternDatabase, those states are reopened at once, as in A*.
+    :param heuristic : Manhattan, LinearConflict or PatternDatabase, Manhattan if None
+    :param deadline->float : Seconds before the best path so far is returned
+    :param weight->float : Initial weight on h
+    :param weight_step->float : How much the weight drops after each path
+    :param on_solution->callable : Called as on_solution(path, cost, bound, elapsed) for every improved path,
+                                   bound being a proven ceiling on cost / optimal cost
+    :param monitor->SearchMonitor : Collects metrics, a default sampling one if None
+    """
+    start = PuzzleState(initial_state.config, initial_state.n)
+    goal = goal_key(start.n)
+    if heuristic is None:
+        heuristic = Manhattan(start.n)
+    reopen = not getattr(heuristic, "consistent", False)
+    start.h = heuristic(start.key)
+    
+    best = {start.key: start} # Cheapest state generated so far for each key
+    frontier = PriorityQueue()
+    frontier.push(weight * start.h, start, start.h)
+    closed = set()
+    incons = {} # States improved after being closed, reopened with the next weight
+    goal_state = start if start.key == goal else None
+    path_to_goal = None
+    
+    nodes_expanded = 0
+    generated = 0
+    duplicates = 0
+    max_search_depth = 0
+    depth_histogram = defaultdict(int)
+    
+    if monitor is None:
+        monitor = SearchMonitor()
+    sample_every = monitor.sample_every
+    monitor.start()
+    end_time = time.perf_counter() + deadline
+    expired = False
+    
+    w = weight
+    while True:
+        # Improve the path under the current weight
+        while not frontier.empty() and (goal_state is None or goal_state.cost > frontier.peek()):
+            # Before popping, so that every state left unexpanded stays open for the bound
+            if nodes_expanded % 256 == 0 and time.perf_counter() >= end_time:
+                expired = True
+                break
+            state = frontier.pop()
+            closed.add(state.key)
             nodes_expanded += 1
+            depth_histogram[state.cost] += 1
+            if nodes_expanded % sample_every == 0:
+                monitor.sample(nodes_expanded, len(frontier), generated, duplicates)
+            
+            children = state.expand(heuristic)
+            generated += len(children)
             for neighbor in children:
-                if tuple(neighbor.config) not in explored and frontier.contains(neighbor.config) == False:
-                    cost = calculate_total_cost(neighbor)
-                    frontier.push(cost, neighbor)
-                    max_search_depth = max(neighbor.cost, max_search_depth)
+                known = best.get(neighbor.key)
+                if known is not None and known.cost <= neighbor.cost:
+                    duplicates += 1
+                    continue
+                best[neighbor.key] = neighbor
+                max_search_depth = max(neighbor.cost, max_search_depth)
+                if neighbor.key == goal:
+                    goal_state = neighbor
+                if neighbor.key in closed and not reopen:
+                    incons[neighbor.key] = neighbor
+                else:
+                    frontier.push(neighbor.cost + w * neighbor.h, neighbor, neighbor.h)
+        
+        if goal_state is not None and (path_to_goal is None or goal_state.cost < len(path_to_goal)):
+            path_to_goal = get_path(goal_state)
+            if on_solution is not None:
+                # Every state on an optimal path not yet closed is open or inconsistent
+                lower = min([s.cost + s.h for s in frontier.states()] +
+                            [s.cost + s.h for s in incons.values()] + [goal_state.cost])
+                bound = goal_state.cost / lower if lower > 0 else 1.0
+                if not expired: # Only a finished pass is within w of the optimum
+                    bound = min(w, bound)
+                on_solution(path_to_goal, goal_state.cost, bound, time.perf_counter() - monitor.start_time)
+        
+        if expired or w <= 1:
+            break
+        
+        # Lower the weight and reopen the states that became inconsistent
+        w = max(1.0, w - weight_step)
+        queued = frontier.states() + list(incons.values())
+        frontier = PriorityQueue()
+        for state in queued:
+            frontier.push(state.cost + w * state.h, state, state.h)
+        closed.clear()
+        incons = {}
+        if time.perf_counter() >= end_time:
+            break
+    
+    monitor.finish(nodes_expanded, len(frontier), generated, duplicates, depth_histogram)
+    if path_to_goal is None:
+        return None
+    writeOutput(path_to_goal, str(len(path_to_goal)), nodes_expanded, len(path_to_goal),
+                max_search_depth, monitor.running_time, monitor.max_ram_usage)
+    return path_to_goal
+
+def ida_search(initial_state, heuristic=None, monitor=None):
+    """
+    IDA * search, None for an unsolvable start
+    :param heuristic : Manhattan, LinearConflict or PatternDatabase, Manhattan if None
+    :param monitor->SearchMonitor : Collects metrics, a default sampling one if None
+    """
+    n = initial_state.n
+    bits = tile_bits(n)
+    mask = (1 << bits) - 1
+    goal = goal_key(n)
+    moves = move_table(n)
+    if heuristic is None:
+        heuristic = Manhattan(n)
+    update = heuristic.update
+    path_to_goal = [] # Actions on the current branch, pushed and popped in place
+    counters = [0, 0, 0] # nodes_expanded, max_search_depth, generated
+    depth_histogram = defaultdict(int)
+    
+    if monitor is None:
+        monitor = SearchMonitor()
+    sample_every = monitor.sample_every
+    monitor.start()
+    
+    def contour(key, blank, prev_blank, g, h, bound):
+        """depth first search below bound, returns -1 when the goal is found"""
+        f = g + h
+        if f > bound:
+            return f
+        if key == goal:
+            return -1
+        counters[0] += 1
+        counters[2] += len(moves[blank])
+        depth_histogram[g] += 1
+        if g + 1 > counters[1]:
+            counters[1] = g + 1
+        if counters[0] % sample_every == 0: # The frontier of a depth first search is its path
+            monitor.sample(counters[0], len(path_to_goal), counters[2], 0)
+        next_bound = math.inf
+        for action, target in moves[blank]:
+            if target == prev_blank: # Never undo the previous move
+                continue
+            shift = bits * target
+            tile = (key >> shift) & mask
+            child = key - (tile << shift) + (tile << (bits * blank))
+            path_to_goal.append(action)
+            t = contour(child, target, blank, g + 1, update(h, key, child, tile, target, blank), bound)
+            if t < 0:
+                return t
+            path_to_goal.pop()
+            if t < next_bound:
+                next_bound = t
+        return next_bound
+    
+    if not is_solvable(initial_state.config, n): # The bound would grow forever
+        monitor.finish(0, 0, 0, 0, depth_histogram)
+        return None
+    
+    h = heuristic(initial_state.key)
+    bound = h
+    while True:
+        t = contour(initial_state.key, initial_state.blank_index, -1, 0, h, bound)
+        if t < 0:
+            break
+        bound = t
+    
+    monitor.finish(counters[0], len(path_to_goal), counters[2], 0, depth_histogram)
+    writeOutput(path_to_goal, str(len(path_to_goal)), counters[0], len(path_to_goal),
+                counters[1], monitor.running_time, monitor.max_ram_usage)
+    return path_to_goal
 
 def calculate_total_cost(state):
     """calculate the total estimated cost of a state"""
+    n = state.n
+    bits = tile_bits(n)
+    mask = (1 << bits) - 1
+    dist = manhattan_table(n)
+    key = state.key
     cost = state.cost
-    for i in range(len(state.config)):
-        cost += calculate_manhattan_dist(i, state.config[i], state.n)
+    for i in range(n * n): # The blank's row of the table is all zeros
+        cost += dist[(key >> (bits * i)) & mask][i]
     return cost
 
+def count_linear_conflicts(config, n):
+    """
+    Number of tiles that have to leave their goal row or column so that
+    the others can pass each other, summed over all rows and columns.
+    Each of them costs two moves on top of the manhattan distance.
+    """
+    removed = 0
+    for line in range(n):
+        row = [tile % n for tile in config[line*n : (line+1)*n] if tile and tile // n == line]
+        col = [tile // n for tile in config[line::n] if tile and tile % n == line]
+        removed += _line_conflict_removals(row) + _line_conflict_removals(col)
+    return removed
+
+def _line_conflict_removals(goals):
+    """
+    :param goals->List : Goal coordinates of the tiles already in this line, in board order
+    :return how many tiles must step out, the line less its longest increasing run of goals
+    """
+    tails = [] # tails[i] : smallest last goal of an increasing subsequence of length i + 1
+    for goal in goals:
+        i = bisect.bisect_left(tails, goal)
+        if i == len(tails):
+            tails.append(goal)
+        else:
+            tails[i] = goal
+    return len(goals) - len(tails)
+
+class Manhattan(object):
+    """
+        Sum of the manhattan distances of all tiles. Calling it scores a
+        packed key from scratch; update scores a child from its parent's
+        value with one lookup in a (tile, from, to) delta table.
+    """
+    consistent = True # No move changes h by more than its cost of 1
+
+    def __init__(self, n):
+        cells = n * n
+        dist = manhattan_table(n)
+        self.n    = n
+        self.bits = tile_bits(n)
+        self.dist = dist
+        # delta[tile][src][dst] : change in distance when tile slides from src to dst
+        self.delta = [[[dist[tile][dst] - dist[tile][src] for dst in range(cells)]
+                       for src in range(cells)] for tile in range(cells)]
+
+    def __call__(self, key):
+        """heuristic value of the board with this packed key"""
+        bits = self.bits
+        mask = (1 << bits) - 1
+        dist = self.dist
+        h = 0
+        for i in range(self.n * self.n):
+            h += dist[(key >> (bits * i)) & mask][i]
+        return h
+
+    def update(self, h, key, child, tile, src, dst):
+        """
+        Value of child, reached from key by sliding tile from src to dst.
+        :param h->int : Value of key
+        """
+        return h + self.delta[tile][src][dst]
+
+class LinearConflict(Manhattan):
+    """
+        Manhattan distance plus two moves per tile that has to leave its
+        goal row or column. A move only shifts one tile across one line,
+        so update recounts at most one row or column. Counts are memoized
+        by the goal coordinates of the line's own tiles, of which there
+        are only a few hundred even on the 24-puzzle.
+    """
+    def __init__(self, n):
+        Manhattan.__init__(self, n)
+        self._lines = {}
+
+    def __call__(self, key):
+        """heuristic value of the board with this packed key"""
+        return Manhattan.__call__(self, key) + 2 * count_linear_conflicts(decode(key, self.n), self.n)
+
+    def line_conflicts(self, key, line, is_row):
+        """tiles that must step out of one row or column of key"""
+        n = self.n
+        bits = self.bits
+        mask = (1 << bits) - 1
+        if is_row:
+            cells = range(line * n, (line + 1) * n)
+        else:
+            cells = range(line, n * n, n)
+        tiles = [(key >> (bits * i)) & mask for i in cells]
+        if is_row:
+            goals = tuple(tile % n for tile in tiles if tile and tile // n == line)
+        else:
+            goals = tuple(tile // n for tile in tiles if tile and tile % n == line)
+        removed = self._lines.get(goals)
+        if removed is None:
+            removed = self._lines[goals] = _line_conflict_removals(goals)
+        return removed
+
+    def update(self, h, key, child, tile, src, dst):
+        """
+        Value of child, reached from key by sliding tile from src to dst.
+        :param h->int : Value of key
+        """
+        n = self.n
+        h += self.delta[tile][src][dst]
+        goal_row, goal_col = divmod(tile, n)
+        if src // n != dst // n: # Vertical slide, only the tile's goal row can change
+            if goal_row == src // n or goal_row == dst // n:
+                h += 2 * (self.line_conflicts(child, goal_row, True) - self.line_conflicts(key, goal_row, True))
+        elif goal_col == src % n or goal_col == dst % n: # Horizontal slide, only its goal column
+            h += 2 * (self.line_conflicts(child, goal_col, False) - self.line_conflicts(key, goal_col, False))
+        return h
+
 def calculate_manhattan_dist(idx, value, n):
     """calculate the manhattan distance of a tile"""
     curr_row = int(idx / n)
@@ -321,30 +874,111 @@ def calculate_manhattan_dist(idx, value, n):
     goal_col = int(value % n)
     return abs(curr_row - goal_row) + abs(curr_col - goal_col)
 
+def is_solvable(config, n):
+    """
+    Permutation parity test against the goal. Every move keeps the parity
+    of the tile inversions, plus the blank's row on even widths, unchanged.
+    """
+    tiles = [tile for tile in config if tile != 0]
+    inversions = 0
+    for i in range(len(tiles)):
+        for j in range(i + 1, len(tiles)):
+            if tiles[j] < tiles[i]:
+                inversions += 1
+    if n % 2 == 0:
+        inversions += config.index(0) // n
+    return inversions % 2 == 0
+
 def test_goal(puzzle_state):
     """test the state is the goal state or not"""
-    for i in range(9):
-        if i != puzzle_state.config[i]:
-            return False
-    return True
+    return puzzle_state.key == goal_key(puzzle_state.n)
 
 # Main Function that reads in Input and Runs corresponding Algorithm
+def parse_options(argv):
+    """
+    Split command line arguments into positionals and flags. Flags look
+    like --name or --name=value and may appear anywhere.
+    :return (list of positionals, dict of flag name to value)
+    """
+    args    = [arg for arg in argv if not arg.startswith("--")]
+    options = dict((arg[2:].split("=", 1) + [""])[:2] for arg in argv if arg.startswith("--"))
+    return args, options
+
 def main():
-    search_mode = sys.argv[1].lower()
-    begin_state = sys.argv[2].split(",")
+    args, options = parse_options(sys.argv[1:])
+    
+    search_mode = args[0].lower()
+    if search_mode == "batch":
+        import batch
+        batch.main(args[1:], options)
+        return
+    begin_state = args[1].split(",")
     begin_state = list(map(int, begin_state))
     board_size  = int(math.sqrt(len(begin_state)))
     hard_state  = PuzzleState(begin_state, board_size)
+    heuristic   = None
+    if len(args) > 2 and args[2].lower() == "pdb":
+        from pattern_db import PatternDatabase
+        heuristic = PatternDatabase(board_size)
+    elif len(args) > 2 and args[2].lower() == "lc":
+        heuristic = LinearConflict(board_size)
+    
+    # --sample=N, --tracemalloc, --profile and --stats=PATH ("-" for stdout)
+    monitor = SearchMonitor(sample_every=int(options.get("sample") or 1024),
+                            memory="tracemalloc" if "tracemalloc" in options else "rusage",
+                            profile="profile" in options)
     start_time  = time.time()
     
-    if   search_mode == "bfs": bfs_search(hard_state)
-    elif search_mode == "dfs": dfs_search(hard_state)
-    elif search_mode == "ast": A_star_search(hard_state)
+    if   search_mode == "bfs": bfs_search(hard_state, monitor)
+    elif search_mode == "dfs": dfs_search(hard_state, monitor)
+    elif search_mode == "bibfs": bibfs_search(hard_state, monitor)
+    elif search_mode == "ast":
+        cache = None
+        if "cache" in options: # --cache keeps solutions in memory only, --cache=PATH also on disk
+            from solution_cache import SolutionCache
+            cache = SolutionCache(board_size, path=options["cache"] or None)
+        A_star_search(hard_state, heuristic, monitor, cache)
+        if cache is not None:
+            cache.close()
+    elif search_mode == "ida": ida_search(hard_state, heuristic, monitor)
+    elif search_mode == "ara":
+        def report(path, cost, bound, elapsed):
+            print("solution: cost_of_path: %d bound: %.3f time: %.6f" % (cost, bound, elapsed))
+        ara_search(hard_state, heuristic, float(options.get("deadline") or 1.0),
+                   float(options.get("weight") or 3.0), float(options.get("weight-step") or 0.5),
+                   on_solution=report, monitor=monitor)
+    elif search_mode == "oracle":
+        if board_size != 3:
+            print("The oracle mode only supports 3x3 boards !")
+        else:
+            from oracle import oracle_search
+            oracle_search(hard_state)
+    elif search_mode == "ext":
+        from external_search import external_search
+        external_search(hard_state, options.get("workdir") or None,
+                        int(options.get("chunk") or 1 << 20), monitor)
+    elif search_mode == "bfs-np":
+        from batched import bfs_batched
+        bfs_batched(hard_state, monitor)
+    elif search_mode == "beam": # Not optimal, --width boards kept per layer
+        from batched import beam_search
+        beam_search(hard_state, int(options.get("width") or 1024),
+                    int(options["max-depth"]) if options.get("max-depth") else None, monitor)
+    elif search_mode == "layers": # Layer sizes of a full disk-backed BFS from the given state
+        from external_search import enumerate_layers
+        sizes = enumerate_layers(board_size, hard_state.key,
+                                 int(options["max-depth"]) if options.get("max-depth") else None,
+                                 options.get("workdir") or None, int(options.get("chunk") or 1 << 20))
+        for depth, size in enumerate(sizes):
+            print("%d %d" % (depth, size))
     else: 
         print("Enter valid command arguments !")
         
     end_time = time.time()
     print("Program completed in %.3f second(s)"%(end_time-start_time))
+    if options.get("stats") and search_mode in ("bfs", "dfs", "bibfs", "ast", "ida", "ara", "ext",
+                                                   "bfs-np", "beam"):
+        monitor.write_json(options["stats"])
 
 if __name__ == '__main__':
     main()
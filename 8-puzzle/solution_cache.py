@@ -0,0 +1,98 @@
+"""
+Cache of solved states for repeated puzzle queries.
+
+Every suffix of an optimal path is optimal, so one solve tells us the
+distance to the goal, and the move to make, for every state on its
+path. The cache keeps that (distance, next action) pair per packed key in
+a bounded LRU in memory. It can also be backed by a dbm file on disk that
+survives across runs. Following the next actions from any cached state
+spells out its optimal path without search.
+"""
+import dbm
+from collections import OrderedDict
+
+
+class SolutionCache(object):
+    """
+        Optimal distance and next move of states of one board size, in an
+        LRU of at most capacity entries plus an optional on-disk store.
+    """
+    def __init__(self, n, capacity=1 << 20, path=None):
+        """
+        :param n->int : Size of the board
+        :param capacity->int : Entries kept in memory
+        :param path->string : dbm file used as a second level, memory only if None
+        """
+        self.n        = n
+        self.capacity = capacity
+        self.entries  = OrderedDict()
+        self.disk     = dbm.open(path, "c") if path is not None else None
+        self.hits     = 0
+        self.misses   = 0
+
+    def get(self, key, disk=True):
+        """
+        :param disk->bool : Fall back to the on-disk store on a memory miss
+        :return (distance, next action) for key, or None
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        if disk and self.disk is not None:
+            value = self.disk.get(str(key))
+            if value is not None:
+                distance, action = value.decode().split(" ")
+                entry = (int(distance), None if action == "-" else action)
+                self._remember(key, entry)
+                self.hits += 1
+                return entry
+        self.misses += 1
+        return None
+
+    def distance(self, key, disk=True):
+        """optimal number of moves from key to the goal, or None if unknown"""
+        entry = self.get(key, disk)
+        return None if entry is None else entry[0]
+
+    def _remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def store(self, state, path_to_goal):
+        """
+        Record every state along an optimal path.
+        :param state->PuzzleState : Where the path starts
+        :param path_to_goal->List : Its actions
+        """
+        remaining = len(path_to_goal)
+        for action in path_to_goal + [None]:
+            entry = (remaining, action)
+            self._remember(state.key, entry)
+            if self.disk is not None:
+                self.disk[str(state.key)] = "%d %s" % (remaining, action or "-")
+            if action is not None:
+                state = state.move(action)
+                remaining -= 1
+
+    def path_from(self, state):
+        """
+        :param state->PuzzleState
+        :return the optimal actions from state to the goal, or None if any
+                state along the way is not cached
+        """
+        path_to_goal = []
+        entry = self.get(state.key)
+        while entry is not None and entry[0] > 0:
+            path_to_goal.append(entry[1])
+            state = state.move(entry[1])
+            entry = self.get(state.key)
+        return None if entry is None else path_to_goal
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+            self.disk = None
@@ -0,0 +1,153 @@
+"""
+Parallel batch solving of large sudoku files.
+
+Boards are read one per line, in any format of sudoku.py (81 digits with
+0 for empty for a 9 x 9 board), from a file or from stdin ("-"), and
+streamed to a process pool in chunks. Blank lines are skipped, and every
+other line, whatever the board size, gets exactly one output line. Every
+solved board is written on its own line, in input order, as soon as the
+chunks before it are done. A line that is not a valid board is reported
+on stderr and written back as given, like an unsolvable board. Only a
+bounded window of chunks is in flight, so memory stays flat however long
+the input is.
+
+    python sudoku.py batch sudokus_start.txt output.txt --workers=4 --chunk=256 --quiet
+
+With --numpy each chunk first goes through the vectorized singles
+propagation of vectorized.py, and only the boards it leaves unsolved are
+searched. Chunks of a few thousand boards suit it best.
+
+With --cache every worker keeps an in-memory solution cache, see
+solution_cache.py, so repeats of a puzzle up to symmetry skip search.
+With --numpy as well, it serves the boards the vectorized rounds leave
+to the scalar solver. The on-disk store is not shared between workers
+and is not used here.
+"""
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from sudoku import DEFAULT_LEVEL, solve, print_board, board_to_string, string_to_board
+
+_cache = None # SolutionCache of this worker process, built on first use
+
+
+def solve_line(line, solver="csp", level=DEFAULT_LEVEL, cached=False):
+    """
+    :return the solved board string of line. Unsolvable boards, and lines
+             that are not valid boards, come back as given so the output
+             stays aligned with the input
+    """
+    global _cache
+    try:
+        board = string_to_board(line)
+        if cached:
+            if _cache is None:
+                from solution_cache import SolutionCache
+                _cache = SolutionCache()
+            return board_to_string(_cache.solve(board, solver, level))
+        return board_to_string(solve(board, solver, level))
+    except Exception as e:
+        print("Bad board line %r : %s" % (line, e), file=sys.stderr)
+        return line
+
+
+def solve_chunk(lines, solver="csp", level=DEFAULT_LEVEL, vectorized=False, cached=False):
+    """:return the solved board string of every line, unsolvable boards come back as given"""
+    if vectorized:
+        from vectorized import solve_boards
+        return solve_boards(lines, solver, level, cached)
+    return [solve_line(line, solver, level, cached) for line in lines]
+
+
+def _chunks(lines, chunk_size):
+    """lists of up to chunk_size board lines"""
+    chunk = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _emit(lines, solutions, output, on_solved):
+    for line, solution in zip(lines, solutions):
+        output.write(solution + "\n")
+        if on_solved is not None:
+            on_solved(line, solution)
+    return len(solutions)
+
+
+def run_batch(source, output, solver="csp", level=DEFAULT_LEVEL, workers=None,
+              chunk_size=64, window=None, on_solved=None, vectorized=False, cached=False):
+    """
+    Solve every board of source across a process pool.
+    :param source->iterable : Board lines, blank lines are skipped
+    :param output->file : Receives one solved board per line, in input order
+    :param workers->int : Pool size, os.cpu_count() if None
+    :param chunk_size->int : Boards sent to a worker at a time
+    :param window->int : Chunks in flight at once, 4 per worker if None
+    :param on_solved->function : Called with (board line, solution line) in order
+    :param vectorized->bool : Propagate singles over whole chunks with NumPy first
+    :param cached->bool : Look boards up in a per worker symmetry cache before solving
+    :return number of boards written
+    """
+    workers = workers or os.cpu_count() or 1
+    window = window or 4 * workers
+
+    written = 0
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk in _chunks(source, chunk_size):
+            pending.append((chunk, pool.submit(solve_chunk, chunk, solver, level, vectorized, cached)))
+            if len(pending) >= window: # Emit the oldest before reading further
+                chunk, future = pending.popleft()
+                written += _emit(chunk, future.result(), output, on_solved)
+        while pending:
+            chunk, future = pending.popleft()
+            written += _emit(chunk, future.result(), output, on_solved)
+    output.flush()
+    return written
+
+
+def _print_boards(line, solution):
+    try:
+        board = string_to_board(line)
+    except Exception: # Written back as given, already reported by the worker
+        return
+    print_board(board)
+    print_board(string_to_board(solution))
+
+
+def main(args, options):
+    """
+    sudoku.py batch [input file or -] [output file or -] [--solver=csp|dlx] [--level=N]
+        [--workers=N] [--chunk=N] [--quiet] [--numpy] [--cache]
+    """
+    source = args[0] if len(args) > 0 else "sudokus_start.txt"
+    target = args[1] if len(args) > 1 else "output.txt"
+    solver = options.get("solver") or "csp"
+    level = int(options.get("level") or DEFAULT_LEVEL)
+    workers = int(options["workers"]) if options.get("workers") else None
+    chunk_size = int(options.get("chunk") or 64)
+    quiet = "quiet" in options or target == "-"
+
+    infile = sys.stdin if source == "-" else open(source, "r")
+    outfile = sys.stdout if target == "-" else open(target, "w")
+    try:
+        written = run_batch(infile, outfile, solver, level, workers, chunk_size,
+                            on_solved=None if quiet else _print_boards, vectorized="numpy" in options,
+                            cached="cache" in options)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+    if target != "-":
+        print("Finishing all %d boards in file." % written)
@@ -0,0 +1,203 @@
+"""
+Benchmark and verification harness for the sudoku solvers.
+
+Every board of the start file is solved with the chosen backend and timed
+with perf_counter, best of --repeat runs after --warmup passes over the
+whole file. The search counters (nodes, backtracks and propagations) are
+recorded per board. Every solution is checked against the rules of the
+game, with givens kept and every unit holding each value once, and
+against the matching line of the finish file. Percentiles of the times
+are reported, and results are written as JSON so that later runs can be
+compared:
+
+    python benchmark.py --output=base.json
+    python benchmark.py --baseline=base.json --level=3
+
+The run exits with status 1 if any board is wrong, or if it regressed
+against the baseline.
+"""
+import sys
+import json
+import math
+import time
+import platform
+import statistics
+
+from sudoku import DEFAULT_LEVEL, solve, board_layout, board_to_string, string_to_board, parse_options
+
+COUNTERS = ("nodes", "backtracks", "propagations")
+PERCENTILES = (50, 90, 99, 100)
+
+# Differences below this are noise, whatever the relative tolerance says
+MIN_TIME_DELTA = 0.001
+
+
+def check_solution(start, solution):
+    """:return None if solution solves start by the rules, else what is wrong with it"""
+    start, solved = string_to_board(start), string_to_board(solution)
+    layout = board_layout(start)
+    if board_layout(solved) is not layout:
+        return "not a %d x %d board" % (layout.size, layout.size)
+    for key in layout.keys:
+        if start[key] != 0 and start[key] != solved[key]:
+            return "given changed at %s" % key
+    for unit in layout.units:
+        if sorted(solved[layout.keys[i]] for i in unit) != list(range(1, layout.size + 1)):
+            return "unit at %s does not hold 1-%d once" % (layout.keys[unit[0]], layout.size)
+    return None
+
+
+def percentile(values, q):
+    """nearest rank percentile of values, q in 0-100"""
+    ordered = sorted(values)
+    return ordered[max(0, int(math.ceil(q / 100.0 * len(ordered))) - 1)]
+
+
+def _is_board(line):
+    try:
+        string_to_board(line)
+    except Exception:
+        return False
+    return True
+
+
+def _read_boards(path, limit=None):
+    """every line of path that parses as a board of any size"""
+    with open(path) as f:
+        boards = [line.strip() for line in f if line.strip() and _is_board(line)]
+    return boards[:limit] if limit else boards
+
+
+def run_benchmark(starts, finishes, solver="csp", level=DEFAULT_LEVEL, warmup=1, repeat=1):
+    """
+    :return list of per board records: best time, search counters, correctness
+    """
+    for _ in range(warmup):
+        for line in starts:
+            solve(string_to_board(line), solver, level)
+
+    records = []
+    for index, line in enumerate(starts):
+        best = None
+        for _ in range(repeat):
+            stats = {}
+            board = string_to_board(line)
+            start_time = time.perf_counter()
+            solved_board = solve(board, solver, level, stats)
+            elapsed = time.perf_counter() - start_time
+            best = elapsed if best is None else min(best, elapsed)
+
+        solution = board_to_string(solved_board)
+        error = check_solution(line, solution)
+        if error is None and index < len(finishes) and finishes[index] != solution:
+            error = "differs from the finish file"
+        record = {"index": index, "time": best, "correct": error is None}
+        record.update(stats)
+        if error is not None:
+            record["error"] = error
+        records.append(record)
+    return records
+
+
+def summarize(records):
+    """totals of the counters, time percentiles and how many boards are right"""
+    times = [record["time"] for record in records]
+    summary = {
+        "boards": len(records),
+        "correct": sum(record["correct"] for record in records),
+        "total_time": sum(times),
+        "mean_time": statistics.mean(times),
+        "stdev_time": statistics.stdev(times) if len(times) > 1 else 0.0,
+    }
+    for q in PERCENTILES:
+        summary["p%d_time" % q] = percentile(times, q)
+    for counter in COUNTERS:
+        summary[counter] = sum(record.get(counter, 0) for record in records)
+    return summary
+
+
+def compare(report, baseline, tolerance=0.25):
+    """
+    :return list of human readable regressions of report against baseline.
+    Boards that were right and are now wrong always count. Counters are
+    deterministic, so any increase is one. Times have to grow by more than
+    tolerance and the noise floor.
+    """
+    regressions = []
+    previous = dict((record["index"], record) for record in baseline["boards"])
+    for record in report["boards"]:
+        base = previous.get(record["index"])
+        if base is not None and base["correct"] and not record["correct"]:
+            regressions.append("board %d: now wrong, %s" % (record["index"], record.get("error")))
+
+    current, base = report["summary"], baseline["summary"]
+    for counter in COUNTERS:
+        if current[counter] > base[counter]:
+            regressions.append("%s %d -> %d" % (counter, base[counter], current[counter]))
+    for name in ["total_time"] + ["p%d_time" % q for q in PERCENTILES]:
+        if current[name] > base[name] * (1 + tolerance) and current[name] - base[name] > MIN_TIME_DELTA:
+            regressions.append("%s %.6fs -> %.6fs" % (name, base[name], current[name]))
+    return regressions
+
+
+def main():
+    """
+    benchmark.py [--solver=csp|dlx] [--level=N] [--start=sudokus_start.txt]
+        [--finish=sudokus_finish.txt] [--limit=N] [--warmup=1] [--repeat=1]
+        [--output=PATH] [--baseline=PATH] [--tolerance=0.25]
+    """
+    _, options = parse_options(sys.argv[1:])
+    solver = options.get("solver") or "csp"
+    level = int(options.get("level") or DEFAULT_LEVEL)
+    limit = int(options["limit"]) if options.get("limit") else None
+    warmup = int(options.get("warmup") or 1)
+    repeat = int(options.get("repeat") or 1)
+
+    starts = _read_boards(options.get("start") or "sudokus_start.txt", limit)
+    finishes = _read_boards(options.get("finish") or "sudokus_finish.txt", limit)
+    records = run_benchmark(starts, finishes, solver, level, warmup, repeat)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "solver": solver,
+            "level": level,
+            "warmup": warmup,
+            "repeat": repeat,
+        },
+        "summary": summarize(records),
+        "boards": records,
+    }
+
+    summary = report["summary"]
+    print("%s level %d: %d/%d boards correct" % (solver, level, summary["correct"], summary["boards"]))
+    print("time total %.6fs  mean %.6fs  stdev %.6fs" % (summary["total_time"], summary["mean_time"],
+                                                        summary["stdev_time"]))
+    print("  ".join("p%d %.6fs" % (q, summary["p%d_time" % q]) for q in PERCENTILES))
+    print("  ".join("%s %d" % (counter, summary[counter]) for counter in COUNTERS))
+    for record in records:
+        if not record["correct"]:
+            print("WRONG board %d: %s" % (record["index"], record["error"]))
+
+    if options.get("output"):
+        with open(options["output"], "w") as f:
+            json.dump(report, f, indent=2)
+
+    failed = summary["correct"] < summary["boards"]
+    if options.get("baseline"):
+        with open(options["baseline"]) as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("solver") != solver or baseline["meta"].get("level") != level:
+            print("warning: baseline was run with another solver or level", file=sys.stderr)
+        regressions = compare(report, baseline, float(options.get("tolerance") or 0.25))
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if not regressions:
+            print("No regressions against %s" % options["baseline"])
+        failed = failed or bool(regressions)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Exact cover backend: Knuth's Algorithm X with Dancing Links.
+
+A sudoku is an exact cover problem. For a 9 x 9 board there are 324
+constraint columns, one per cell (it holds a value), per row and digit,
+per column and digit and per box and digit. Each of the 729 candidate
+rows, one per (cell, value), covers exactly four of them. A solution is
+a set of 81 rows covering every column once. Other board sizes scale the
+same way, 4 * size^2 columns and size^3 rows.
+
+Nodes live in flat integer lists (left, right, up, down, column) instead
+of one object each. Node 0 is the root, nodes 1 to 4 * size^2 are the
+column headers, and the 4 nodes of candidate row r follow from
+first_row + 4r. The linked structure is identical for every board of a
+size, so it is built once and copied per solve; givens are then selected
+before the search.
+"""
+from sudoku import LAYOUT, board_layout
+
+
+def row_columns(row, layout=LAYOUT):
+    """the four constraint columns, 1 based header nodes, of candidate row = size * cell + value - 1"""
+    k, size = layout.k, layout.size
+    area = size * size
+    cell, digit = divmod(row, size)
+    r, c = divmod(cell, size)
+    box = k * (r // k) + c // k
+    return (1 + cell, 1 + area + size * r + digit, 1 + 2 * area + size * c + digit,
+            1 + 3 * area + size * box + digit)
+
+
+def _build_template(layout):
+    """(left, right, up, down, column, size) of the full candidate x constraint matrix"""
+    columns = 4 * layout.size ** 2
+    first_row = columns + 1
+    nodes = first_row + 4 * layout.size ** 3
+    left   = [0] * nodes
+    right  = [0] * nodes
+    up     = list(range(nodes))
+    down   = list(range(nodes))
+    column = list(range(nodes))
+    size   = [0] * (columns + 1)
+
+    for c in range(columns + 1): # Header ring through the root
+        left[c] = c - 1 if c > 0 else columns
+        right[c] = c + 1 if c < columns else 0
+
+    for row in range(layout.size ** 3):
+        first = first_row + 4 * row
+        for k, c in enumerate(row_columns(row, layout)):
+            node = first + k
+            left[node] = first + (k - 1) % 4
+            right[node] = first + (k + 1) % 4
+            column[node] = c
+            up[node] = up[c]
+            down[node] = c
+            down[up[c]] = node
+            up[c] = node
+            size[c] += 1
+    return left, right, up, down, column, size
+
+_templates = {} # Box size -> template
+
+def template(layout=LAYOUT):
+    if layout.k not in _templates:
+        _templates[layout.k] = _build_template(layout)
+    return _templates[layout.k]
+
+
+class DancingLinks(object):
+    """
+        The sudoku exact cover matrix of one solve.
+    """
+    def __init__(self, layout=LAYOUT):
+        self.layout    = layout
+        self.first_row = 4 * layout.size ** 2 + 1 # Node of the first candidate row
+        self.left, self.right, self.up, self.down, self.column, self.size = \
+            [list(array) for array in template(layout)]
+        self.solution = [] # Candidate rows picked so far
+        self.nodes      = 0 # Rows tried by search
+        self.backtracks = 0 # Rows search had to take back
+        self.covers     = 0 # Columns covered
+
+    def cover(self, c):
+        """unlink column c and every row that meets it"""
+        left, right, up, down, column, size = \
+            self.left, self.right, self.up, self.down, self.column, self.size
+        self.covers += 1
+        right[left[c]] = right[c]
+        left[right[c]] = left[c]
+        i = down[c]
+        while i != c:
+            j = right[i]
+            while j != i:
+                down[up[j]] = down[j]
+                up[down[j]] = up[j]
+                size[column[j]] -= 1
+                j = right[j]
+            i = down[i]
+
+    def uncover(self, c):
+        """relink column c, exactly undoing cover(c)"""
+        left, right, up, down, column, size = \
+            self.left, self.right, self.up, self.down, self.column, self.size
+        i = up[c]
+        while i != c:
+            j = left[i]
+            while j != i:
+                size[column[j]] += 1
+                down[up[j]] = j
+                up[down[j]] = j
+                j = left[j]
+            i = up[i]
+        right[left[c]] = c
+        left[right[c]] = c
+
+    def select(self, row):
+        """
+        Commit to a candidate row before searching, as for a given.
+        :return False if one of its columns is already covered
+        """
+        right = self.right
+        for c in row_columns(row, self.layout):
+            if right[self.left[c]] != c: # Unlinked from the header ring
+                return False
+            self.cover(c)
+        self.solution.append(row)
+        return True
+
+    def search(self):
+        """Algorithm X, always branching on the column with fewest rows"""
+        right, left, down, column, size = self.right, self.left, self.down, self.column, self.size
+        if right[0] == 0:
+            return True # Every column covered
+
+        c = right[0]
+        best = c
+        while c != 0:
+            if size[c] < size[best]:
+                best = c
+                if size[c] <= 1:
+                    break
+            c = right[c]
+        c = best
+        if size[c] == 0:
+            return False
+
+        self.cover(c)
+        r = down[c]
+        while r != c:
+            self.nodes += 1
+            self.solution.append((r - self.first_row) // 4)
+            j = right[r]
+            while j != r:
+                self.cover(column[j])
+                j = right[j]
+            if self.search():
+                return True
+            j = left[r]
+            while j != r:
+                self.uncover(column[j])
+                j = left[j]
+            self.solution.pop()
+            self.backtracks += 1
+            r = down[r]
+        self.uncover(c)
+        return False
+
+
+def dlx_solve(board, stats=None):
+    """
+    Takes a board and returns solved board, like sudoku.backtracking.
+    :param stats->dict : Receives nodes, backtracks and propagations (column covers) if given
+    """
+    layout = board_layout(board)
+    links = DancingLinks(layout)
+    consistent = all(links.select(layout.size * cell + board[key] - 1)
+                     for cell, key in enumerate(layout.keys) if board[key] != 0)
+    if consistent and links.search():
+        for row in links.solution:
+            cell, digit = divmod(row, layout.size)
+            board[layout.keys[cell]] = digit + 1
+    if stats is not None:
+        stats.update(nodes=links.nodes, backtracks=links.backtracks, propagations=links.covers)
+    return board
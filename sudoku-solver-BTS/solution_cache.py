@@ -0,0 +1,227 @@
+"""
+Cache of solved boards, shared between boards that are the same puzzle
+up to the symmetries of sudoku.
+
+Relabelling the digits, permuting bands, rows within a band, stacks or
+columns within a stack, and transposing all map a puzzle to another one
+whose solutions are the images of its own. Each board is reduced to a
+canonical form under these transforms, and the cache is keyed on it.
+The solution stored is the canonical form's, and a hit maps it back
+through the inverse of the transform that produced the board's form.
+
+The canonical form is the smallest board, with digits renumbered in
+order of first appearance, over every transform that lists bands, rows,
+stacks and columns in order of their signatures. Signatures only count
+givens, so every symmetry leaves them unchanged, and equivalent boards
+get the same candidate set and the same minimum. Only ties between
+signatures have to be enumerated. Boards with more than max_candidates
+tied orders are solved without the cache.
+
+Entries live in a bounded LRU in memory and optionally in a dbm file on
+disk that survives across runs.
+"""
+import dbm
+import math
+import itertools
+from collections import OrderedDict
+
+from sudoku import DEFAULT_LEVEL, solve, board_layout
+
+# Orders to try per board before giving up on canonicalizing it
+MAX_CANDIDATES = 2048
+
+
+def transpose(grid, size):
+    return [grid[size * c + r] for r in range(size) for c in range(size)]
+
+
+def _line_signatures(grid, size):
+    """
+    Per row: its number of givens, the given counts of the columns it has
+    givens in, and how often each of its given digits appears overall.
+    """
+    counts = [0] * (size + 1)
+    for v in grid:
+        counts[v] += 1
+    row_givens = [sum(1 for c in range(size) if grid[size * r + c]) for r in range(size)]
+    col_givens = [sum(1 for r in range(size) if grid[size * r + c]) for c in range(size)]
+    signatures = []
+    for r in range(size):
+        values = [(c, grid[size * r + c]) for c in range(size) if grid[size * r + c]]
+        signatures.append((row_givens[r],
+                           tuple(sorted(col_givens[c] for c, _ in values)),
+                           tuple(sorted(counts[v] for _, v in values))))
+    return signatures
+
+
+def _tied_orders(keys):
+    """every order of range(len(keys)) sorted by key, permuting equal keys"""
+    ranked = sorted(range(len(keys)), key=lambda i: keys[i])
+    groups = [list(group) for _, group in itertools.groupby(ranked, key=lambda i: keys[i])]
+    for choice in itertools.product(*[itertools.permutations(group) for group in groups]):
+        yield [i for group in choice for i in group]
+
+
+def _count_orders(keys):
+    total = 1
+    for _, group in itertools.groupby(sorted(keys)):
+        total *= math.factorial(len(list(group)))
+    return total
+
+
+def line_orders(grid, k, limit):
+    """
+    Every row order consistent with the signatures: bands by the sorted
+    signatures of their rows, then rows within each band.
+    :return list of orders, or None if there are more than limit
+    """
+    size = k * k
+    signatures = _line_signatures(grid, size)
+    bands = [tuple(sorted(signatures[k * b + i] for i in range(k))) for b in range(k)]
+    total = _count_orders(bands)
+    for b in range(k):
+        total *= _count_orders(signatures[k * b : k * b + k])
+    if total > limit:
+        return None
+
+    inside = [list(_tied_orders(signatures[k * b : k * b + k])) for b in range(k)]
+    orders = []
+    for band_order in _tied_orders(bands):
+        for rows in itertools.product(*[inside[b] for b in band_order]):
+            orders.append([k * b + i for b, band_rows in zip(band_order, rows) for i in band_rows])
+    return orders
+
+
+def relabelling(values, size):
+    """value -> label in order of first appearance, unseen values after, 0 kept"""
+    labels = [0] * (size + 1)
+    next_label = 1
+    for v in values:
+        if v and not labels[v]:
+            labels[v] = next_label
+            next_label += 1
+    for v in range(1, size + 1):
+        if not labels[v]:
+            labels[v] = next_label
+            next_label += 1
+    return labels
+
+
+def apply_transform(grid, transform, size):
+    """the image of grid under (transposed, row order, column order, labels)"""
+    transposed, rows, cols, labels = transform
+    if transposed:
+        grid = transpose(grid, size)
+    return [labels[grid[size * r + c]] for r in rows for c in cols]
+
+
+def invert_transform(grid, transform, size):
+    """the grid that transform maps to grid"""
+    transposed, rows, cols, labels = transform
+    values = [0] * (size + 1)
+    for v in range(size + 1):
+        values[labels[v]] = v
+    original = [0] * (size * size)
+    for i, r in enumerate(rows):
+        for j, c in enumerate(cols):
+            original[size * r + c] = values[grid[size * i + j]]
+    return transpose(original, size) if transposed else original
+
+
+def canonical_form(grid, layout, limit=MAX_CANDIDATES):
+    """
+    :return (canonical grid, transform taking grid to it), or None if the
+             board has too many tied orders to canonicalize
+    """
+    size = layout.size
+    best = None
+    for transposed in (False, True):
+        oriented = transpose(grid, size) if transposed else grid
+        rows = line_orders(oriented, layout.k, limit)
+        cols = line_orders(transpose(oriented, size), layout.k, limit) if rows is not None else None
+        if cols is None or len(rows) * len(cols) > limit:
+            return None
+        for row_order in rows:
+            for col_order in cols:
+                values = [oriented[size * r + c] for r in row_order for c in col_order]
+                labels = relabelling(values, size)
+                image = [labels[v] for v in values]
+                if best is None or image < best[0]:
+                    best = (image, (transposed, row_order, col_order, labels))
+    return best
+
+
+class SolutionCache(object):
+    """
+        Solutions of canonical boards, in an LRU of at most capacity
+        entries plus an optional on-disk store.
+    """
+    def __init__(self, capacity=1 << 16, path=None, max_candidates=MAX_CANDIDATES):
+        """
+        :param capacity->int : Entries kept in memory
+        :param path->string : dbm file used as a second level, memory only if None
+        :param max_candidates->int : Tied orders tried before a board skips the cache
+        """
+        self.capacity       = capacity
+        self.max_candidates = max_candidates
+        self.entries        = OrderedDict()
+        self.disk           = dbm.open(path, "c") if path is not None else None
+        self.hits           = 0
+        self.misses         = 0
+        self.skipped        = 0
+
+    def get(self, key):
+        """:return the canonical solution string for key, "" if unsolvable, or None"""
+        entry = self.entries.get(key)
+        if entry is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                entry = value.decode()
+        if entry is not None:
+            self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def put(self, key, entry):
+        self._remember(key, entry)
+        if self.disk is not None:
+            self.disk[key] = entry
+
+    def solve(self, board, solver="csp", level=DEFAULT_LEVEL, stats=None):
+        """Takes a board and returns solved board, like sudoku.solve, searching only on a miss."""
+        layout = board_layout(board)
+        size = layout.size
+        grid = [board[key] for key in layout.keys]
+        form = canonical_form(grid, layout, self.max_candidates)
+        if form is None:
+            self.skipped += 1
+            return solve(board, solver, level, stats)
+
+        canonical, transform = form
+        key = "%d:%s" % (layout.k, ",".join(map(str, canonical)))
+        entry = self.get(key)
+        if entry is not None:
+            self.hits += 1
+            if stats is not None:
+                stats.update(nodes=0, backtracks=0, propagations=0)
+            if entry:
+                solution = invert_transform([int(v) for v in entry.split(",")], transform, size)
+                for i, key in enumerate(layout.keys):
+                    board[key] = solution[i]
+            return board
+
+        self.misses += 1
+        board = solve(board, solver, level, stats)
+        solution = [board[key] for key in layout.keys]
+        self.put(key, "" if 0 in solution else ",".join(map(str, apply_transform(solution, transform, size))))
+        return board
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+            self.disk = None
@@ -1,168 +1,463 @@
 #!/usr/bin/env python
 #coding:utf-8
 import sys
+import math
 import time
-import copy
-import statistics
+import string
 
 """
 Each sudoku board is represented as a dictionary with string keys and
 int values.
 e.g. my_board['A1'] = 8
+
+Boards are made of k x k boxes, with k * k rows, columns and values:
+9 x 9 for k = 3, 16 x 16 for k = 4 and 25 x 25 for k = 5. Rows are
+lettered from A and columns numbered from 1, so a 16 x 16 board has keys
+'A1' to 'P16'. Boards are written one per line, row by row, with 0 for an
+empty cell. Either every value is a single character, digits then
+letters for values above 9 ('.' also marks an empty cell), or values are
+separated by commas or spaces. A 9 x 9 board is 81 digits as before.
+
+Internally the solver works on a grid, a list of the cell values indexed
+row by row (cell = size * row + col, 0 for empty), and on domains, one
+candidate mask per cell where bit v - 1 is set while value v is still
+possible. The tables describing a board size live in a Layout.
 """
 
-ROW = "ABCDEFGHI"
-COL = "123456789"
+
+class MaskTable(dict):
+    """
+        Lazily filled mask -> f(mask) table, for board sizes whose masks
+        are too wide to tabulate up front.
+    """
+    def __init__(self, f):
+        dict.__init__(self)
+        self.f = f
+
+    def __missing__(self, mask):
+        value = self[mask] = self.f(mask)
+        return value
+
+
+class Layout(object):
+    """
+        Cell, unit and mask tables of boards with k x k boxes.
+    """
+    def __init__(self, k):
+        if not 2 <= k <= 5:
+            raise Exception("Box size must be between 2 and 5 : ", k)
+        size = k * k
+        self.k    = k
+        self.size = size
+        self.rows = string.ascii_uppercase[:size]
+        self.cols = [str(c) for c in range(1, size + 1)]
+
+        self.cells = range(size * size)
+        self.keys  = [self.rows[i // size] + self.cols[i % size] for i in self.cells] # Cell index -> board key
+
+        # Rows, columns and boxes as tuples of cell indices
+        self.units = ([tuple(size * r + c for c in range(size)) for r in range(size)] +
+                      [tuple(size * r + c for r in range(size)) for c in range(size)] +
+                      [tuple(size * (br + r) + bc + c for r in range(k) for c in range(k))
+                       for br in range(0, size, k) for bc in range(0, size, k)])
+        self.cell_units = [[] for _ in self.cells]
+        for unit in self.units:
+            for i in unit:
+                self.cell_units[i].append(unit)
+        self.cell_units = [tuple(units) for units in self.cell_units]
+        # The cells sharing a unit with each cell
+        self.peers = [tuple(sorted(set(j for unit in self.cell_units[i] for j in unit) - {i}))
+                      for i in self.cells]
+
+        self.all_values = (1 << size) - 1
+        self.bit = [0] + [1 << (v - 1) for v in range(1, size + 1)] # Value -> mask
+        count = lambda mask: bin(mask).count("1")
+        values = lambda mask: tuple(v for v in range(1, size + 1) if mask & self.bit[v])
+        if size <= 9:
+            self.popcount = [count(mask) for mask in range(self.all_values + 1)]  # Mask -> domain size
+            self.values   = [values(mask) for mask in range(self.all_values + 1)] # Mask -> values in it
+        else:
+            self.popcount = MaskTable(count)
+            self.values   = MaskTable(values)
+
+_layouts = {}
+
+def layout(k=3):
+    """the Layout of boards with k x k boxes, built once"""
+    if k not in _layouts:
+        _layouts[k] = Layout(k)
+    return _layouts[k]
+
+def board_layout(board):
+    """the Layout of a board dictionary, or of a list of its values"""
+    size = math.isqrt(len(board))
+    k = math.isqrt(size)
+    if k ** 4 != len(board):
+        raise Exception("Not a square board of square boxes : ", len(board))
+    return layout(k)
+
+# The classic 9 x 9 tables
+LAYOUT     = layout(3)
+ROW        = LAYOUT.rows
+COL        = "".join(LAYOUT.cols)
+CELLS      = LAYOUT.cells
+KEYS       = LAYOUT.keys
+UNITS      = LAYOUT.units
+CELL_UNITS = LAYOUT.cell_units
+PEERS      = LAYOUT.peers
+ALL_VALUES = LAYOUT.all_values
+BIT        = LAYOUT.bit
+POPCOUNT   = LAYOUT.popcount
+VALUES     = LAYOUT.values
+
+# Propagation levels, each one adds rules to the previous ones
+FORWARD_CHECK  = 0 # Remove an assigned value from the peers of its cell
+ARC_CONSISTENT = 1 # AC-3 to a fixpoint, naked singles get placed
+HIDDEN_SINGLES = 2 # A value with one place left in a unit goes there
+PAIRS          = 3 # Naked and hidden pairs per unit
+DEFAULT_LEVEL  = HIDDEN_SINGLES
 
 
 def print_board(board):
     """Helper function to print board in a square."""
-    print("-----------------")
-    for i in ROW:
+    layout = board_layout(board)
+    width = len(str(layout.size))
+    print("-" * ((width + 1) * layout.size - 1))
+    for i in layout.rows:
         row = ''
-        for j in COL:
-            row += (str(board[i + j]) + " ")
+        for j in layout.cols:
+            row += (str(board[i + j]).rjust(width) + " ")
         print(row)
 
 
 def board_to_string(board):
-    """Helper function to convert board dictionary to string for writing."""
-    ordered_vals = []
-    for r in ROW:
-        for c in COL:
-            ordered_vals.append(str(board[r + c]))
-    return ''.join(ordered_vals)
-
-
-def backtracking(board):
-    """Takes a board and returns solved board."""
-    csp = {ROW[r] + COL[c]: [i for i in range(1, 10)] for r in range(9) for c in range(9)}
-    neighbors = {ROW[r] + COL[c]: [i for i in range(1, 10)] for r in range(9) for c in range(9)}
-    fill(neighbors)
-    check_consistent(board, csp, neighbors)
-    backtracking_recursive(board, csp)
-    
+    """Helper function to convert board dictionary to string for writing, comma separated above 9 x 9."""
+    layout = board_layout(board)
+    ordered_vals = [str(board[key]) for key in layout.keys]
+    return ('' if layout.size <= 9 else ',').join(ordered_vals)
+
+
+def string_to_board(line):
+    """Helper function to parse a board line, scanning L to R, Up to Down, into a board dictionary."""
+    line = line.strip()
+    if "," in line or " " in line:
+        values = [int(v) for v in line.replace(",", " ").split()]
+    else:
+        values = [0 if ch == "." else int(ch, 36) for ch in line]
+    layout = board_layout(values)
+    if max(values) > layout.size or min(values) < 0:
+        bad = max(values) if max(values) > layout.size else min(values)
+        raise Exception("Value out of range for a %d x %d board : " % (layout.size, layout.size), bad)
+    return dict(zip(layout.keys, values))
+
+
+class CSP(object):
+    """
+        Grid and domains of a board being solved. Every change goes on a
+        trail so that search can roll back to any earlier checkpoint.
+        Empty cells are also bucketed by domain size for mrv. A cell joins
+        the bucket of every size its domain takes, and stale entries are
+        only dropped when mrv meets them.
+    """
+    def __init__(self, grid, domains, level=DEFAULT_LEVEL, layout=LAYOUT):
+        self.grid    = grid
+        self.domains = domains
+        self.level   = level
+        self.layout  = layout
+        self.trail   = [] # (cell, previous mask, previous value) per change
+        self.buckets = [set() for _ in range(layout.size + 1)] # Domain size -> empty cells
+        for i in layout.cells:
+            if grid[i] == 0:
+                self.buckets[layout.popcount[domains[i]]].add(i)
+        self.empty_domains = len(self.buckets[0]) # Empty cells without candidates
+        self.nodes        = 0 # Values tried by search
+        self.backtracks   = 0 # Values search had to take back
+        self.propagations = 0 # Domains narrowed by forward checking and propagation
+
+    def mark(self):
+        """checkpoint to pass to undo"""
+        return len(self.trail)
+
+    def restrict(self, cell, mask):
+        """narrow the domain of cell to mask"""
+        self.trail.append((cell, self.domains[cell], self.grid[cell]))
+        if self.grid[cell] == 0:
+            self.buckets[self.layout.popcount[mask]].add(cell)
+            if mask == 0:
+                self.empty_domains += 1
+        self.domains[cell] = mask
+        self.propagations += 1
+
+    def assign(self, cell, val):
+        self.trail.append((cell, self.domains[cell], self.grid[cell]))
+        self.grid[cell] = val
+        self.domains[cell] = self.layout.bit[val]
+
+    def undo(self, mark):
+        """roll every change made since mark back, latest first"""
+        trail, grid, domains, buckets = self.trail, self.grid, self.domains, self.buckets
+        popcount = self.layout.popcount
+        while len(trail) > mark:
+            cell, mask, val = trail.pop()
+            if val == 0:
+                if domains[cell] == 0:
+                    self.empty_domains -= 1
+                buckets[popcount[mask]].add(cell)
+            domains[cell] = mask
+            grid[cell] = val
+
+    def statistics(self):
+        return {"nodes": self.nodes, "backtracks": self.backtracks, "propagations": self.propagations}
+
+
+def backtracking(board, level=DEFAULT_LEVEL, stats=None):
+    """
+    Takes a board and returns solved board.
+    :param stats->dict : Receives the search counters of CSP.statistics if given
+    """
+    layout = board_layout(board)
+    grid = [board[key] for key in layout.keys]
+    domains = check_consistent(grid, layout)
+    csp = CSP(grid, domains or [0] * len(grid), level, layout)
+    if (domains is not None
+            and (level == FORWARD_CHECK
+                 or propagate(csp, [i for i in layout.cells if layout.popcount[domains[i]] == 1]))
+            and backtracking_recursive(csp)):
+        for i in layout.cells:
+            board[layout.keys[i]] = grid[i]
+    if stats is not None:
+        stats.update(csp.statistics())
+
     solved_board = board
     return solved_board
 
-def fill(neighbors):
-    for i in range(9):
-        for j in range(9):
-            values = set()
-            for r in range(3):
-                for c in range(3):
-                    values.add(ROW[r + int(i / 3) * 3] + COL[c + int(j / 3) * 3])
-            for c in range(9):
-                values.add(ROW[i] + COL[c])
-            for r in range(9):
-                values.add(ROW[r] + COL[j])
-
-            values.remove(ROW[i] + COL[j])
-            neighbors[ROW[i] + COL[j]] = values
-            
-def check_consistent(board, csp, neighbors):
-    for r in range(9):
-        for c in range(9):
-            val = board[ROW[r] + COL[c]]
-            if board[ROW[r] + COL[c]] != 0:
-                for n in neighbors[ROW[r] + COL[c]]:
-                    if val in csp[n]:
-                        csp[n].remove(val)
-                csp[ROW[r] + COL[c]] = [val]
-                
-def backtracking_recursive(board, csp):
-    r = -1
-    c = -1
-    for i in range(9):
-        for j in range(9):
-            if board[ROW[i] + COL[j]] == 0: # Finding location of empty cells
-                r = i
-                c = j               
-    if r == -1:
+def check_consistent(grid, layout=LAYOUT):
+    """Initial domains of the grid, or None if two givens clash."""
+    domains = [layout.all_values] * len(grid)
+    for i in layout.cells:
+        if grid[i] != 0:
+            bit = layout.bit[grid[i]]
+            if not domains[i] & bit:
+                return None
+            domains[i] = bit
+            for p in layout.peers[i]:
+                domains[p] &= ~bit
+    return domains
+
+def backtracking_recursive(csp):
+    if csp.empty_domains:
+        return False # Some empty cell has no candidate left
+    cell = mrv(csp)
+    if cell == -1:
         return True # Done
-    
-    r, c = mrv(board, csp)
-    csp_for_backtracking = copy.deepcopy(csp)
-    for val in range(1, 10):
-        if satisfies(board, r, c, val):
-            board[ROW[r] + COL[c]] = val
-            result = update(csp, r, c, val)
-            if result != -1:
-                if backtracking_recursive(board, csp):
-                    return True
-            csp = csp_for_backtracking # Backtracking
-            board[ROW[r] + COL[c]] = 0 # Backtracking
-    return False 
-
-def mrv(board, csp):
-    minimum_row = -1
-    minimum_col = -1 
-    length = 9999 
-    for r in range(9):
-        for c in range(9):
-            if board[ROW[r] + COL[c]] == 0:
-                if len(csp[ROW[r] + COL[c]]) < length:
-                    minimum_row = r
-                    minimum_col = c
-                    length = len(csp[ROW[r] + COL[c]])
-    return minimum_row, minimum_col
-
-def satisfies(board, r, c, val):
-    for row in range(3): # Checks box
-        for col in range(3):
-            if board[ROW[row + int(r / 3) * 3] + COL[col + int(c / 3) * 3]] == val:
+
+    checkpoint = csp.mark()
+    for val in csp.layout.values[csp.domains[cell]]:
+        csp.nodes += 1
+        if update(csp, cell, val):
+            if backtracking_recursive(csp):
+                return True
+        csp.undo(checkpoint) # Backtracking
+        csp.backtracks += 1
+    return False
+
+def mrv(csp):
+    """
+    Empty cell with the fewest candidates, -1 if the grid is full. Reads the
+    lowest non-empty domain size bucket, so it never scans the grid.
+    """
+    grid, domains, popcount = csp.grid, csp.domains, csp.layout.popcount
+    for size, bucket in enumerate(csp.buckets):
+        while bucket:
+            cell = bucket.pop()
+            if grid[cell] == 0 and popcount[domains[cell]] == size:
+                bucket.add(cell)
+                return cell
+    return -1
+
+def update(csp, cell, val):
+    """Assign val to cell and propagate, False if some cell runs out of candidates."""
+    csp.assign(cell, val)
+    if csp.level > FORWARD_CHECK:
+        return propagate(csp, [cell])
+
+    bit = csp.layout.bit[val]
+    domains = csp.domains
+    for p in csp.layout.peers[cell]:
+        if domains[p] & bit:
+            csp.restrict(p, domains[p] & ~bit)
+            if domains[p] == 0:
                 return False
-                
-    for col in range(9): # Checks row
-        if board[ROW[r] + COL[col]] == val:
+    return True
+
+def propagate(csp, queue):
+    """
+    Run every rule up to csp.level until none of them changes a domain.
+    :param queue->list : Cells whose domain just became a single value
+    :return False on a contradiction
+    """
+    while True:
+        if not arc_consistency(csp, queue):
             return False
-            
-    for row in range(9): # Checks column
-        if board[ROW[row] + COL[c]] == val:
+        if csp.level < HIDDEN_SINGLES:
+            return True
+        checkpoint = csp.mark()
+        if not hidden_singles(csp, queue):
+            return False
+        if csp.mark() == checkpoint and csp.level >= PAIRS:
+            if not pairs(csp, queue):
+                return False
+        if csp.mark() == checkpoint:
+            return True # Fixpoint
+
+def arc_consistency(csp, queue):
+    """
+    AC-3 on the all-different constraints. An arc into a cell can only be
+    revised once its domain is a single value, so the queue holds those
+    cells; each is placed on the grid and its value removed from its peers.
+    """
+    grid, domains, layout = csp.grid, csp.domains, csp.layout
+    peers, popcount = layout.peers, layout.popcount
+    while queue:
+        cell = queue.pop()
+        mask = domains[cell]
+        if grid[cell] == 0:
+            csp.assign(cell, layout.values[mask][0]) # Naked single
+        for p in peers[cell]:
+            if domains[p] & mask:
+                reduced = domains[p] & ~mask
+                if reduced == 0:
+                    return False
+                csp.restrict(p, reduced)
+                if popcount[reduced] == 1:
+                    queue.append(p)
+    return True
+
+def hidden_singles(csp, queue):
+    """Restrict a cell to a value it is the only place for in some unit, False if a value has no place."""
+    domains, layout = csp.domains, csp.layout
+    for unit in layout.units:
+        once = 0
+        twice = 0
+        for i in unit:
+            twice |= once & domains[i]
+            once |= domains[i]
+        if once != layout.all_values:
             return False
-    
+        only = once & ~twice
+        if only:
+            for i in unit:
+                mask = domains[i] & only
+                if mask and mask != domains[i]:
+                    if layout.popcount[mask] > 1:
+                        return False # Two values that can only go in this one cell
+                    csp.restrict(i, mask)
+                    queue.append(i)
     return True
 
-def update(csp, r, c, val):
-    for row in range(3):
-        for col in range(3):
-            if val in csp[ROW[row + int(r / 3) * 3] + COL[col + int(c / 3) * 3]]:
-                csp[ROW[row + int(r / 3) * 3] + COL[col + int(c / 3) * 3]].remove(val)
-                
-    for col in range(9):
-        if val in csp[ROW[r] + COL[col]]:
-            csp[ROW[r] + COL[col]].remove(val)
-
-    for row in range(9):
-        if val in csp[ROW[row] + COL[c]]:
-            csp[ROW[row] + COL[c]].remove(val)
-    
-    csp[ROW[r] + COL[c]] = [val] # Adds value back
-    
-    for row in range(9):
-        for col in range(9):
-            if len(csp[ROW[row] + COL[col]]) == 0:
-                return False 
+def pairs(csp, queue):
+    """
+    Naked pairs: two cells of a unit left with the same two values take
+    them from the rest of the unit. Hidden pairs: two values that can only
+    go in the same two cells of a unit leave those cells nothing else.
+    """
+    domains, layout = csp.domains, csp.layout
+    popcount, values, bit = layout.popcount, layout.values, layout.bit
+    for unit in layout.units:
+        naked = {}
+        places = [0] * (layout.size + 1) # Value -> positions in the unit, as a mask
+        for position, i in enumerate(unit):
+            mask = domains[i]
+            for v in values[mask]:
+                places[v] |= 1 << position
+            if popcount[mask] != 2:
+                continue
+            if mask not in naked:
+                naked[mask] = i
+                continue
+            for j in unit:
+                if j != i and j != naked[mask] and domains[j] & mask:
+                    reduced = domains[j] & ~mask
+                    if reduced == 0:
+                        return False
+                    csp.restrict(j, reduced)
+                    if popcount[reduced] == 1:
+                        queue.append(j)
+
+        hidden = {}
+        for v in range(1, layout.size + 1):
+            if popcount[places[v]] != 2:
+                continue
+            if places[v] not in hidden:
+                hidden[places[v]] = v
+                continue
+            both = bit[v] | bit[hidden[places[v]]]
+            for position in values[places[v]]:
+                i = unit[position - 1]
+                if domains[i] & ~both:
+                    csp.restrict(i, domains[i] & both)
     return True
 
+def solve(board, solver="csp", level=DEFAULT_LEVEL, stats=None):
+    """
+    Takes a board and returns solved board, with either backend.
+    :param solver->string : "csp" for backtracking, "dlx" for dancing links
+    :param level->int : Propagation level of the csp backend
+    :param stats->dict : Receives nodes, backtracks and propagations if given
+    """
+    if solver == "dlx":
+        from dlx import dlx_solve
+        return dlx_solve(board, stats)
+    if solver != "csp":
+        raise Exception("Unknown solver : ", solver)
+    return backtracking(board, level, stats)
+
+def parse_options(argv):
+    """
+    Split command line arguments into positionals and flags. Flags look
+    like --name or --name=value and may appear anywhere.
+    :return (list of positionals, dict of flag name to value)
+    """
+    args    = [arg for arg in argv if not arg.startswith("--")]
+    options = dict((arg[2:].split("=", 1) + [""])[:2] for arg in argv if arg.startswith("--"))
+    return args, options
+
 
 if __name__ == '__main__':
 
-    if len(sys.argv) > 1:
+    # --solver=csp|dlx picks the backend, --level=0..3 the csp propagation rules
+    args, options = parse_options(sys.argv[1:])
+    solver = options.get("solver") or "csp"
+    level = int(options.get("level") or DEFAULT_LEVEL)
+    cache = None
+    if "cache" in options and (not args or args[0] != "batch"):
+        # --cache keeps solutions in memory only, --cache=PATH also on disk
+        from solution_cache import SolutionCache
+        cache = SolutionCache(path=options["cache"] or None)
+
+    if len(args) > 0 and args[0] == "batch":
+
+        # Streamed parallel solving, see batch.py
+        import batch
+        batch.main(args[1:], options)
+
+    elif len(args) > 0:
 
         #  Read individual board from command line arg.
-        sudoku = sys.argv[1]
+        sudoku = args[0]
 
-        if len(sudoku) != 81:
-            print("Error reading the sudoku string %s" % sys.argv[1])
+        try:
+            board = string_to_board(sudoku)
+        except Exception:
+            print("Error reading the sudoku string %s" % args[0])
         else:
-            board = { ROW[r] + COL[c]: int(sudoku[9*r+c])
-                      for r in range(9) for c in range(9)}
-            
             print_board(board)
 
             start_time = time.time()
-            solved_board = backtracking(board)
+            if cache is None:
+                solved_board = solve(board, solver, level)
+            else:
+                solved_board = cache.solve(board, solver, level)
             end_time = time.time()
 
             print_board(solved_board)
@@ -187,33 +482,32 @@ if __name__ == '__main__':
         out_filename = 'output.txt'
         outfile = open(out_filename, "w")
 
-        '''
-        results_filename = 'README.txt' # Setting up README.txt
-        results_file = open(results_filename, "w") 
-        boards_solved = 0
-        running_times = []
-        '''
-
         # Solve each board using backtracking
         for line in sudoku_list.split("\n"):
 
-            if len(line) < 9:
+            if not line.strip():
                 continue
 
             # Parse boards to dict representation, scanning board L to R, Up to Down
-            board = { ROW[r] + COL[c]: int(line[9*r+c])
-                    for r in range(9) for c in range(9)}
+            try:
+                board = string_to_board(line)
+            except Exception as e:
+                # Written back as given, like batch mode, so output lines match input lines
+                print("Bad board line %r : %s" % (line.strip(), e))
+                outfile.write(line.strip())
+                outfile.write('\n')
+                continue
 
             # Print starting board.
             print_board(board)
 
             # Solve with backtracking
             start_time = time.time()
-            solved_board = backtracking(board)
+            if cache is None:
+                solved_board = solve(board, solver, level)
+            else:
+                solved_board = cache.solve(board, solver, level)
             end_time = time.time()
-            '''
-            running_times.append(end_time - start_time) # Adding each board's running time to list
-            '''
 
             # Print solved board. 
             print_board(solved_board)
@@ -222,18 +516,9 @@ if __name__ == '__main__':
             outfile.write(board_to_string(solved_board))
             outfile.write('\n')
 
-        '''
-        # Checking how many boards in my output match boards in sudokus_finish.txt
-        with open('output.txt') as actual, open('sudokus_finish.txt') as expected:
-            for line_actual, line_expected in zip(actual, expected):
-                if line_actual.strip() == line_expected.strip():
-                    boards_solved += 1
-                    
-        results_file.write("Number of boards solved: " + str(boards_solved) + "\n")                  
-        results_file.write("Minimum running time: " + str("%.8f" % min(running_times)) + " seconds\n") 
-        results_file.write("Maximum running time: " + str("%.8f" % max(running_times)) + " seconds\n")
-        results_file.write("Mean running time: " + str("%.8f" % statistics.mean(running_times)) + " seconds\n")
-        results_file.write("Standard deviation of running times: " + str("%.8f" % statistics.stdev(running_times)) + " seconds\n")
-        '''
+        # Timing statistics and checks against sudokus_finish.txt are in benchmark.py
         
         print("Finishing all boards in file.")
+
+    if cache is not None:
+        cache.close()
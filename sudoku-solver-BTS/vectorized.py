@@ -0,0 +1,158 @@
+"""
+Vectorized singles propagation over many boards at once with NumPy.
+
+N boards are held as an (N, 81) array of cell values and an (N, 81) array
+of candidates, the same 9-bit masks as the scalar solver's domains. One
+round computes the digits taken in each unit as a bitwise OR over its
+cells, and the candidates of every cell from the three units it is in.
+It then places every naked single (a cell with one candidate) and every
+hidden single (a digit with one place left in a unit), for all boards at
+once. Rounds repeat on the boards that still changed. Boards that turn
+out contradictory (a digit twice in a unit, a cell or a digit with no
+place left) are dropped.
+
+Easy puzzles come out solved. Boards that singles cannot finish are split
+on their empty cell with the fewest candidates, one copy per candidate,
+and every copy is propagated again. The first copy to fill up gives the
+solution of its board. After a few splitting rounds, or once a board has
+more than MAX_OPEN copies open, the boards still open are handed to the
+scalar solver as they were read, so only they pay for Python-level
+search. Unsolvable boards, and lines that are not valid boards, come
+back unchanged.
+
+Only 9 x 9 boards are vectorized, larger ones go straight to the scalar
+solver. NumPy is an optional dependency, only needed by this module.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from sudoku import DEFAULT_LEVEL, UNITS, CELL_UNITS, CELLS, ALL_VALUES, BIT, POPCOUNT, VALUES
+from batch import solve_line
+
+if np is not None:
+    UNIT_CELLS      = np.array(UNITS, dtype=np.intp)              # (27, 9) cells of each unit
+    UNIT_OF         = dict((unit, u) for u, unit in enumerate(UNITS))
+    CELL_UNIT_INDEX = np.array([[UNIT_OF[unit] for unit in CELL_UNITS[i]] for i in CELLS],
+                               dtype=np.intp)                   # (81, 3) units of each cell
+    BIT_OF          = np.array(BIT, dtype=np.uint16)            # Value -> mask
+    POPCOUNT_OF     = np.array(POPCOUNT, dtype=np.uint8)        # Mask -> candidates
+    VALUE_OF        = np.array([VALUES[mask][0] if POPCOUNT[mask] == 1 else 0
+                                for mask in range(512)], dtype=np.uint8) # Single bit mask -> value
+
+# Splitting rounds before falling back to the scalar solver, and the most
+# boards kept open per input board, so bad inputs cannot blow memory up
+MAX_SPLITS = 8
+MAX_OPEN   = 16
+
+
+def _require_numpy():
+    if np is None:
+        raise Exception("The vectorized solver needs numpy, install it with : pip install numpy")
+
+
+def parse_boards(lines):
+    """(N, 81) uint8 array of 81 digit board lines"""
+    data = "".join(lines).encode("ascii")
+    return (np.frombuffer(data, dtype=np.uint8) - ord("0")).reshape(len(lines), 81)
+
+
+def candidate_masks(grids):
+    """
+    :return ((B, 81) candidates of every cell, 0 once filled, (B, 27) digits
+             taken in every unit, (B,) whether a digit repeats in a unit)
+    """
+    unit_bits = BIT_OF[grids][:, UNIT_CELLS]                   # (B, 27, 9)
+    taken = np.bitwise_or.reduce(unit_bits, axis=2)
+    clash = (unit_bits.sum(axis=2, dtype=np.uint16) != taken).any(axis=1)
+    blocked = np.bitwise_or.reduce(taken[:, CELL_UNIT_INDEX], axis=2)
+    candidates = np.where(grids == 0, ALL_VALUES & ~blocked, 0).astype(np.uint16)
+    return candidates, taken, clash
+
+
+def propagate_singles(grids):
+    """
+    Place naked and hidden singles on every board until none is left.
+    :param grids->ndarray : (N, 81) cell values, 0 for empty, not modified
+    :return (propagated grids, boolean array of the boards found contradictory)
+    """
+    grids = grids.copy()
+    dead = np.zeros(len(grids), dtype=bool)
+    active = np.arange(len(grids))
+    while len(active):
+        g = grids[active]
+        candidates, taken, clash = candidate_masks(g)
+        sizes = POPCOUNT_OF[candidates]
+        unit_candidates = candidates[:, UNIT_CELLS]            # (B, 27, 9)
+        once = np.zeros(taken.shape, dtype=np.uint16)
+        twice = np.zeros(taken.shape, dtype=np.uint16)
+        for k in range(9):
+            twice |= once & unit_candidates[:, :, k]
+            once |= unit_candidates[:, :, k]
+
+        bad = (clash | ((g == 0) & (sizes == 0)).any(axis=1)
+               | ((once | taken) != ALL_VALUES).any(axis=1))   # Some digit has no place left
+
+        new = np.where(sizes == 1, VALUE_OF[candidates], 0)
+        hidden = unit_candidates & (once & ~twice)[:, :, None]
+        b, u, k = np.nonzero(hidden)
+        values = VALUE_OF[hidden[b, u, k]]
+        bad[b[values == 0]] = True # One cell is the only place for two digits
+        new[b, UNIT_CELLS[u, k]] = values
+
+        apply = (new != 0) & ~bad[:, None]
+        grids[active] = np.where(apply, new, g)
+        dead[active[bad]] = True
+        active = active[apply.any(axis=1)]
+    return grids, dead
+
+
+def split(grids):
+    """
+    Branch every board on its empty cell with the fewest candidates.
+    :return (one child grid per candidate, index of the parent of each)
+    """
+    candidates, _, _ = candidate_masks(grids)
+    sizes = np.where(grids == 0, POPCOUNT_OF[candidates], 10)
+    cell = sizes.argmin(axis=1)
+    choices = candidates[np.arange(len(grids)), cell]
+    parent, digit = np.nonzero(choices[:, None] & BIT_OF[None, 1:])
+    children = grids[parent]
+    children[np.arange(len(parent)), cell[parent]] = digit + 1
+    return children, parent
+
+
+def solve_boards(lines, solver="csp", level=DEFAULT_LEVEL, cached=False):
+    """
+    Solve a batch of 81 digit board lines.
+    :param solver->string : Backend of sudoku.solve for the boards left open after MAX_SPLITS rounds
+    :param cached->bool : Look those boards up in the worker's symmetry cache, see batch.solve_line
+    :return the solved board string of every line, unsolvable boards come back as given
+    """
+    _require_numpy()
+    solutions = [None] * len(lines)
+    origin = np.array([i for i, line in enumerate(lines) if len(line) == 81 and line.isdigit()],
+                      dtype=np.intp) # Input line of every board in grids
+    grids = parse_boards([lines[i] for i in origin]) if len(origin) else None
+    for splits in range(MAX_SPLITS + 1):
+        if not len(origin):
+            break
+        grids, dead = propagate_singles(grids)
+        full = (grids != 0).all(axis=1) & ~dead
+        for i in np.nonzero(full)[0]:
+            if solutions[origin[i]] is None:
+                solutions[origin[i]] = (grids[i] + ord("0")).tobytes().decode("ascii")
+        open_boards = ~full & ~dead & np.array([solutions[o] is None for o in origin], dtype=bool)
+        grids, origin = grids[open_boards], origin[open_boards]
+        if splits == MAX_SPLITS:
+            break
+        grids, parent = split(grids)
+        origin = origin[parent]
+        crowded = np.bincount(origin, minlength=len(lines))[origin] > MAX_OPEN
+        grids, origin = grids[~crowded], origin[~crowded] # Those boards go to the scalar solver
+
+    for i, line in enumerate(lines):
+        if solutions[i] is None:
+            solutions[i] = solve_line(line, solver, level, cached)
+    return solutions